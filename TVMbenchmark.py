@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+"""
+Tourist Voronoi Map
+Benchmarks
+
+Times the main pipeline stages against synthetic parkrun datasets at
+increasing scale. Everything runs offline in a temporary working folder, with
+a synthetic coastline standing in for the Natural Earth country polygons.
+
+Results are appended to benchmarks/results.csv, tagged with the current git
+commit, so regressions can be compared between commits:
+
+    python TVMbenchmark.py run
+    python TVMbenchmark.py imports
+    python TVMbenchmark.py compare <old_commit> <new_commit>
+
+Created on Mon Oct 19 17:40:00 2026
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from os import path
+
+import numpy as np
+import pandas as pd
+
+__version__ = 2.0
+
+repo_folder = path.dirname(path.abspath(__file__))
+results_file = path.join(repo_folder, "benchmarks", "results.csv")
+
+event_scales = [500, 5000, 50000]
+athlete_scales = [10, 100, 1000, 10000]
+
+# centre and radii (decimal degrees) of the synthetic mainland, roughly the
+# size of Great Britain
+mainland_centre = (-2.0, 54.0)
+mainland_radii = (3.5, 4.0)
+# a small island off the south coast holding a single parkrun, like Medina
+# on the Isle of Wight
+island_centre = (-1.3, 49.1)
+island_radius = 0.2
+# parkruns just off the mainland coast, like those on beaches the Natural
+# Earth coastline misses. Just past the initial buffer of
+# TVMsetup.assign_parkrun_areas, so the buffer has to grow, or they're
+# snapped.
+n_offshore = 5
+offshore_distance = 0.0012
+# London, the region personal_summary reports on
+london_region = 10
+regions = list(range(7, 19))
+
+
+def _mainland_radius(theta):
+    """
+    Radius scale of the synthetic mainland at angle theta. The wiggle gives
+    the coastline some bays and headlands.
+    """
+    return 1 + 0.08 * np.sin(7 * theta) + 0.04 * np.cos(23 * theta)
+
+
+def _mainland_coast(n_vertices=2000):
+    """
+    Vertices of the synthetic mainland coastline, anticlockwise
+    """
+    theta = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    scale = _mainland_radius(theta)
+    return np.column_stack(
+            [mainland_centre[0] + mainland_radii[0] * scale * np.cos(theta),
+             mainland_centre[1] + mainland_radii[1] * scale * np.sin(theta)])
+
+
+def synthetic_coastline(n_vertices=2000):
+    """
+    Synthetic stand in for TVMsetup.get_country_natural_earth
+
+    Output
+    ------
+    (country_gdf, country_gdf_multi) in the same layout as the Natural Earth
+    version: one row per island, and a single multipolygon row.
+    """
+    import geopandas as gpd
+    from fiona.crs import from_epsg
+    from shapely.geometry import Polygon, MultiPolygon
+
+    mainland = Polygon(_mainland_coast(n_vertices))
+    theta = np.linspace(0, 2 * np.pi, 64, endpoint=False)
+    island = Polygon(np.column_stack(
+            [island_centre[0] + island_radius * np.cos(theta),
+             island_centre[1] + island_radius * np.sin(theta)]))
+
+    country_gdf = gpd.GeoDataFrame({"geometry": [mainland, island]})
+    country_gdf_multi = gpd.GeoDataFrame(
+            {"geometry": [MultiPolygon([mainland, island])]})
+    country_gdf.crs = from_epsg(4326)
+    country_gdf_multi.crs = from_epsg(4326)
+    return country_gdf, country_gdf_multi
+
+
+def synthetic_parkruns(n_events, seed=0):
+    """
+    Synthetic parkrun events, in the layout of uk_parkruns.csv
+
+    Most events fall inside the synthetic mainland, n_offshore sit
+    offshore_distance off its coast, and the last one sits alone on the
+    island.
+    """
+    rng = np.random.RandomState(seed)
+    n_main = n_events - 1 - n_offshore
+    theta = rng.uniform(0, 2 * np.pi, n_main)
+    # sqrt gives uniform density over the area, 0.95 keeps off the coast
+    frac = 0.95 * np.sqrt(rng.uniform(0, 1, n_main))
+    scale = frac * _mainland_radius(theta)
+    lo = mainland_centre[0] + mainland_radii[0] * scale * np.cos(theta)
+    la = mainland_centre[1] + mainland_radii[1] * scale * np.sin(theta)
+
+    # out along the normal at coast vertices, away from the island
+    coast = _mainland_coast()
+    tangent = np.roll(coast, -1, axis=0) - np.roll(coast, 1, axis=0)
+    normal = np.column_stack([tangent[:, 1], -tangent[:, 0]])
+    normal /= np.linalg.norm(normal, axis=1)[:, None]
+    north = np.flatnonzero(coast[:, 1] > mainland_centre[1])
+    vertices = rng.choice(north, n_offshore, replace=False)
+    offshore = coast[vertices] + offshore_distance * normal[vertices]
+
+    lo = np.concatenate([lo, offshore[:, 0], [island_centre[0]]])
+    la = np.concatenate([la, offshore[:, 1], [island_centre[1]]])
+
+    ids = np.arange(1, n_events + 1)
+    names = ["Synth {:05d}".format(i) for i in ids]
+    parkruns = pd.DataFrame({"c": 97,
+                             "id": ids,
+                             "la": la.round(6),
+                             "lo": lo.round(6),
+                             "m": names,
+                             "n": [n.lower().replace(" ", "") for n in names],
+                             "r": rng.choice(regions, n_events)})
+    # make sure London is never empty
+    parkruns.loc[0, "r"] = london_region
+    return parkruns
+
+
+def write_geo_xml(parkruns, geo_doc="parkrun_geo.xml"):
+    """
+    Writes parkrun events in the layout of the parkrun geo.xml map document
+    """
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<geo><r id="1" n="World" la="-8.000000" lo="20.000000" z="1" '
+             'pid="" u="">'
+             '<r id="97" n="UK" la="54.600000" lo="-2.000000" z="5" '
+             'pid="1" u="http://www.parkrun.org.uk"/></r>']
+    template = ('<e n="{n}" m="{m}" c="{c}" id="{id}" r="{r}" '
+                'la="{la:.6f}" lo="{lo:.6f}"/>')
+    for row in parkruns.to_dict("records"):
+        lines.append(template.format(**row))
+    lines.append("</geo>")
+    with open(geo_doc, "w") as f:
+        f.write("\n".join(lines))
+    return geo_doc
+
+
+def write_athletes(parkruns, n_athletes, seed=0, max_events=60):
+    """
+    Writes synthetic athlete histories to user/, in the layout of the
+    athlete Event Summaries table.
+
+    Output
+    ------
+    list of athlete names
+    """
+    rng = np.random.RandomState(seed)
+    user_folder = path.normpath("user")
+    if not path.exists(user_folder):
+        os.makedirs(user_folder)
+    events = (parkruns["m"] + " parkrun").values
+    names = []
+    for athlete in range(n_athletes):
+        name = "athlete{:05d}".format(athlete)
+        n_run = rng.randint(1, min(max_events, len(events)) + 1)
+        ran = rng.choice(len(events), n_run, replace=False)
+        runs = rng.geometric(0.3, n_run)
+        history = pd.DataFrame({"Event": events[ran], "Runs": runs})
+        history.to_csv(path.join(user_folder, name + "_parkruns.csv"),
+                       index=False)
+        names.append(name)
+    return names
+
+
+@contextmanager
+def offline_coastline(country_gdf, country_gdf_multi):
+    """
+    Temporarily replaces the Natural Earth download with the given coastline
+    """
+    import TVMsetup
+
+    natural_earth = TVMsetup.get_country_natural_earth
+
+    def get_country_natural_earth(country_code="GBR"):
+        return country_gdf.copy(), country_gdf_multi.copy()
+
+    TVMsetup.get_country_natural_earth = get_country_natural_earth
+    try:
+        yield
+    finally:
+        TVMsetup.get_country_natural_earth = natural_earth
+
+
+@contextmanager
+def workspace():
+    """
+    Runs the block in a temporary working folder with an empty shapefiles
+    folder, as the pipeline reads and writes relative to the working folder.
+    """
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp(prefix="tvm_bench_")
+    os.makedirs(path.join(folder, "shapefiles"))
+    os.chdir(folder)
+    try:
+        yield folder
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def time_call(func, *args, repeat=1, **kwargs):
+    """
+    Best wall clock time (seconds) of repeat calls, and the last result
+    """
+    best = np.inf
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def current_commit():
+    try:
+        commit = subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=repo_folder,
+                stderr=subprocess.DEVNULL)
+        return commit.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class _Budget(object):
+    """
+    Skips a function at larger scales once it has exceeded the time budget,
+    so the O(n^2) stages don't stall the whole suite.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.exceeded = set()
+
+    def allows(self, function):
+        return function not in self.exceeded
+
+    def record(self, function, seconds):
+        if self.seconds is not None and seconds > self.seconds:
+            self.exceeded.add(function)
+
+
+def run_benchmarks(events=event_scales, athletes=athlete_scales, repeat=1,
+                   budget=600, seed=0):
+    """
+    Times the pipeline stages at each scale.
+
+    Input
+    -----
+    events: list of int
+        Number of synthetic parkrun events for the geospatial stages
+
+    athletes: list of int
+        Number of synthetic athletes for group_parkrun, run against the
+        smallest event scale
+
+    repeat: int
+        Number of repeats, the best time is kept
+
+    budget: float
+        Once a stage takes longer than this (seconds) it is skipped at larger
+        scales. None to run everything.
+
+    Returns
+    -------
+    DataFrame with a row per function and scale
+    """
+    import TVMsetup
+    import TVMplotting
+    import personal_parkrun
+    import bulk_summary
+    from VoronoiMapping import voronoi_polygons
+
+    commit = current_commit()
+    stamp = pd.Timestamp.now().isoformat(timespec="seconds")
+    budget = _Budget(budget)
+    rows = []
+
+    def record(function, n_events, n_athletes, func, *args, **kwargs):
+        if not budget.allows(function):
+            rows.append([commit, stamp, function, n_events, n_athletes,
+                         np.nan, "skipped"])
+            print("{:>26} {:>6} events {:>6} athletes      skipped".format(
+                    function, n_events, n_athletes))
+            return None
+        seconds, result = time_call(func, *args, repeat=repeat, **kwargs)
+        budget.record(function, seconds)
+        rows.append([commit, stamp, function, n_events, n_athletes,
+                     seconds, "ok"])
+        print("{:>26} {:>6} events {:>6} athletes {:>10.3f} s".format(
+                function, n_events, n_athletes, seconds))
+        return result
+
+    country_gdf, country_gdf_multi = synthetic_coastline()
+    for n_events in sorted(events):
+        with workspace(), offline_coastline(country_gdf, country_gdf_multi):
+            parkruns = synthetic_parkruns(n_events, seed=seed)
+            write_geo_xml(parkruns)
+            athlete = write_athletes(parkruns, 1, seed=seed)[0]
+
+            record("parkrun_locs_xml2csv", n_events, 0,
+                   TVMsetup.parkrun_locs_xml2csv, geo_doc="parkrun_geo.xml")
+            points = TVMsetup.create_parkrun_point_shp("uk_parkruns",
+                                                       new_XML=False)
+            voronoi = record("voronoi_polygons", n_events, 0,
+                             voronoi_polygons, points, country_gdf_multi)
+            areas = None
+            if voronoi is not None:
+                record("assign_parkrun_areas_snap", n_events, 0,
+                       TVMsetup.assign_parkrun_areas, points,
+                       voronoi, country_gdf,
+                       filename="uk_parkrun_areas", snap=True)
+                areas = record("assign_parkrun_areas", n_events, 0,
+                               TVMsetup.assign_parkrun_areas, points,
+                               voronoi, country_gdf,
+                               filename="uk_parkrun_areas")
+            if areas is not None:
+                # files were just built above, outside the build cache
+                record("setup_plot", n_events, 1,
+                       TVMplotting.setup_plot, athlete, build=False)
+                record("personal_summary", n_events, 1,
+                       TVMplotting.personal_summary, athlete)
+
+            if n_events == min(events):
+                for n_athletes in sorted(athletes):
+                    names = write_athletes(parkruns, n_athletes, seed=seed)
+                    record("group_parkrun", n_events, n_athletes,
+                           personal_parkrun.group_parkrun, names)
+                    if areas is not None:
+                        record("export_summaries", n_events, n_athletes,
+                               bulk_summary.export_summaries, names,
+                               report_seconds=np.inf)
+
+    return pd.DataFrame(rows, columns=["commit", "timestamp", "function",
+                                       "events", "athletes", "seconds",
+                                       "status"])
+
+
+_import_script = """
+import sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [m for m in ("bokeh", "geopandas", "fiona", "cartopy", "lxml")
+         if m in sys.modules]
+print(seconds, ",".join(heavy))
+"""
+
+
+def import_times(modules=("TVMcli", "TVMplotting", "personal_parkrun"),
+                 athlete="scot", repeat=5):
+    """
+    Start up cost of the command line stages, each in a fresh interpreter.
+
+    Times importing each module, and the whole of
+    "python TVMcli.py summary athlete" run in the repo folder against the
+    cached shapefiles. Heavy modules loaded by each import are reported.
+
+    Returns
+    -------
+    DataFrame with a row per measurement, best of repeat
+    """
+    commit = current_commit()
+    stamp = pd.Timestamp.now().isoformat(timespec="seconds")
+    rows = []
+    for module in modules:
+        best = np.inf
+        for i in range(repeat):
+            script = _import_script.format(module=module)
+            output = subprocess.check_output(
+                    [sys.executable, "-c", script],
+                    cwd=repo_folder).decode().split()
+            best = min(best, float(output[0]))
+        heavy = output[1] if len(output) > 1 else ""
+        rows.append([commit, stamp, "import " + module, 0, 0, best, "ok"])
+        print("{:>26} {:>10.3f} s  heavy modules: {}".format(
+                "import " + module, best, heavy or "none"))
+
+    best = np.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, "TVMcli.py", "summary",
+                               athlete], cwd=repo_folder,
+                              stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    rows.append([commit, stamp, "cli summary", 0, 1, best, "ok"])
+    print("{:>26} {:>10.3f} s".format("cli summary", best))
+    return pd.DataFrame(rows, columns=["commit", "timestamp", "function",
+                                       "events", "athletes", "seconds",
+                                       "status"])
+
+
+def save_results(results, filename=results_file):
+    """
+    Appends benchmark results to the results csv
+    """
+    folder = path.dirname(filename)
+    if not path.exists(folder):
+        os.makedirs(folder)
+    results.to_csv(filename, mode="a", index=False,
+                   header=not path.exists(filename))
+    return filename
+
+
+def compare_results(old, new, filename=results_file):
+    """
+    Compares the latest benchmark times of two commits
+
+    Output
+    ------
+    DataFrame of old and new times and the ratio new/old for each function
+    and scale. Ratios above 1 are slower.
+    """
+    results = pd.read_csv(filename, dtype={"commit": str})
+    results = results[results["status"] == "ok"]
+    keys = ["function", "events", "athletes"]
+    latest = (results.sort_values("timestamp")
+              .groupby(["commit"] + keys)["seconds"].last())
+    comparison = pd.DataFrame({old: latest.loc[old], new: latest.loc[new]})
+    comparison["ratio"] = comparison[new] / comparison[old]
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Benchmark the tourist voronoi map pipeline")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="time the pipeline stages")
+    run.add_argument("--events", type=int, nargs="+", default=event_scales)
+    run.add_argument("--athletes", type=int, nargs="+",
+                     default=athlete_scales)
+    run.add_argument("--repeat", type=int, default=1)
+    run.add_argument("--budget", type=float, default=600,
+                     help="skip larger scales once a stage exceeds this (s)")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--output", default=results_file)
+    imports = sub.add_parser("imports",
+                             help="time command line start up and imports")
+    imports.add_argument("--athlete", default="scot")
+    imports.add_argument("--repeat", type=int, default=5)
+    imports.add_argument("--output", default=results_file)
+    compare = sub.add_parser("compare", help="compare two commits")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--output", default=results_file)
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        print(compare_results(args.old, args.new, filename=args.output))
+    elif args.command == "imports":
+        results = import_times(athlete=args.athlete, repeat=args.repeat)
+        print("Saved to " + save_results(results, filename=args.output))
+    else:
+        if args.command is None:
+            args = parser.parse_args(["run"])
+        # imports are relative to the repo
+        if repo_folder not in sys.path:
+            sys.path.insert(0, repo_folder)
+        results = run_benchmarks(events=args.events, athletes=args.athletes,
+                                 repeat=args.repeat, budget=args.budget,
+                                 seed=args.seed)
+        print("Saved to " + save_results(results, filename=args.output))
+
+
+if __name__ == "__main__":
+    main()
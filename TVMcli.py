@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Tourist Voronoi Map
+Command line
+
+    python TVMcli.py setup [--spherical] [--snap] [--force]
+    python TVMcli.py summary scot [hayleigh ...]
+    python TVMcli.py plot scot [--detailed]
+    python TVMcli.py batch scot hayleigh [--width 1000] [--details]
+    python TVMcli.py recommend scot hayleigh [--top 10] [--radius 50]
+    python TVMcli.py recommend scot --plan 5 [--radius 50]
+    python TVMcli.py wordcloud [scot hayleigh ...] [--force]
+    python TVMcli.py export [scot hayleigh ...] [--out summaries.parquet]
+
+Each stage only imports the modules it needs, so a summary from the cached
+shapefiles starts without loading bokeh, geopandas or cartopy.
+
+Created on Mon Oct 19 17:47:38 2026
+"""
+
+import argparse
+
+__version__ = 2.0
+
+
+def _name(names):
+    """
+    A single name, or a list for a group
+    """
+    if len(names) == 1:
+        return names[0]
+    return names
+
+
+def run_setup(args):
+    import TVMsetup
+    TVMsetup.setup(spherical=args.spherical, snap=args.snap,
+                   force=args.force)
+
+
+def run_summary(args):
+    import TVMplotting
+    TVMplotting.personal_summary(_name(args.names))
+
+
+def run_plot(args):
+    import TVMplotting
+    if args.detailed:
+        TVMplotting.detailed_personal_plot(name=_name(args.names))
+    else:
+        TVMplotting.simple_personal_plot(name=_name(args.names),
+                                         details=not args.no_details)
+
+
+def run_batch(args):
+    import TVMraster
+    for filepath in TVMraster.batch_pngs(args.names, width=args.width,
+                                         details=args.details):
+        print(filepath)
+
+
+def run_recommend(args):
+    import route_planner
+    if args.plan:
+        for name in args.names:
+            print(name)
+            print(route_planner.plan_route(name, k=args.plan,
+                                           radius_km=args.radius or 50))
+    else:
+        print(route_planner.club_recommendations(args.names, top=args.top,
+                                                 radius_km=args.radius))
+
+
+def run_wordcloud(args):
+    import parkrun_wordcloud
+    names = args.names or None
+    print(parkrun_wordcloud.wordcloud(names, force=args.force).head(10))
+
+
+def run_export(args):
+    import bulk_summary
+    stats = bulk_summary.export_summaries(
+            args.names or None, filepath=args.out,
+            chunk_size=args.chunk_size, processes=args.processes)
+    print("{athletes:d} athletes in {seconds:0.1f} s "
+          "({athletes_per_second:0.1f} athletes/s)".format(**stats))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="parkrun tourism voronoi maps")
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+
+    setup = sub.add_parser("setup",
+                           help="regenerate the parkrun point and area "
+                                "shapefiles")
+    setup.add_argument("--spherical", action="store_true",
+                       help="build the voronoi diagram on the sphere")
+    setup.add_argument("--snap", action="store_true",
+                       help="snap offshore parkruns to the coast instead of "
+                            "buffering the map")
+    setup.add_argument("--force", action="store_true",
+                       help="rebuild every stage")
+    setup.set_defaults(func=run_setup)
+
+    summary = sub.add_parser("summary",
+                             help="print tourism statistics for an athlete, "
+                                  "or a group if several names are given")
+    summary.add_argument("names", nargs="+")
+    summary.set_defaults(func=run_summary)
+
+    plot = sub.add_parser("plot", help="interactive bokeh area map")
+    plot.add_argument("names", nargs="+")
+    plot.add_argument("--detailed", action="store_true",
+                      help="detailed map with parkrun points and tiles")
+    plot.add_argument("--no-details", action="store_true",
+                      help="leave the summary off the simple map")
+    plot.set_defaults(func=run_plot)
+
+    batch = sub.add_parser("batch", help="static PNG map for each athlete")
+    batch.add_argument("names", nargs="+")
+    batch.add_argument("--width", type=int, default=1000)
+    batch.add_argument("--details", action="store_true",
+                       help="add the summary text to each map")
+    batch.set_defaults(func=run_batch)
+
+    recommend = sub.add_parser("recommend",
+                               help="next unvisited parkruns by area gained, "
+                                    "weighted by distance from home")
+    recommend.add_argument("names", nargs="+")
+    recommend.add_argument("--top", type=int, default=10)
+    recommend.add_argument("--radius", type=float, default=None,
+                           help="only parkruns within this many km of home")
+    recommend.add_argument("--plan", type=int, default=0,
+                           help="greedy plan of this many parkruns instead")
+    recommend.set_defaults(func=run_recommend)
+
+    cloud = sub.add_parser("wordcloud",
+                           help="word cloud of events run, by every athlete "
+                                "in user/ unless names are given")
+    cloud.add_argument("names", nargs="*")
+    cloud.add_argument("--force", action="store_true",
+                       help="redraw even if the histories haven't changed")
+    cloud.set_defaults(func=run_wordcloud)
+
+    export = sub.add_parser("export",
+                            help="summary statistics of every athlete in "
+                                 "user/, unless names are given, to a csv "
+                                 "or parquet file")
+    export.add_argument("names", nargs="*")
+    export.add_argument("--out", default=None,
+                        help="output file, maps/athlete_summaries.csv by "
+                             "default")
+    export.add_argument("--chunk-size", type=int, default=100)
+    export.add_argument("--processes", type=int, default=None)
+    export.set_defaults(func=run_export)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,14 +9,12 @@ Created on Fri Sep 15 13:44:58 2017
 
 import numpy as np
 import pandas as pd
-import geopandas as gpd
-from fiona.crs import from_epsg
-import bokeh.plotting as bk
-from bokeh.models import (ColumnDataSource, HoverTool, Label)
-from bokeh.tile_providers import CARTODBPOSITRON_RETINA as uk
-import TVMsetup
 import personal_parkrun
+import parkrun_names
 from os import path
+# geopandas, fiona, bokeh and TVMsetup (cartopy, scipy, lxml) are slow to
+# import, so are imported in the functions that need them. A summary from the
+# cached shapefiles then only needs pandas.
 
 __version__ = 2.0
 
@@ -28,6 +26,7 @@ def import_shapefile(filename):
     """
     Imports shapefile and returns a GeoDataFrame
     """
+    import geopandas as gpd
     if filename[-4:] != ".shp":
         filename = filename + ".shp"
     filepath = path.join(shapefile_folder, filename)
@@ -35,7 +34,29 @@ def import_shapefile(filename):
     return geo_df
 
 
+def import_attributes(filename, force=False):
+    """
+    Imports the attribute table of a shapefile, without the geometry, as a
+    DataFrame. A csv copy is saved alongside the shapefile on first use, as
+    it's much quicker to load and doesn't need geopandas. force rewrites the
+    csv copy.
+    """
+    if filename[-4:] == ".shp":
+        filename = filename[:-4]
+    shp_file = path.join(shapefile_folder, filename + ".shp")
+    csv_file = path.join(shapefile_folder, filename + ".csv")
+    if not force and path.exists(csv_file) and (
+            not path.exists(shp_file)
+            or path.getmtime(csv_file) >= path.getmtime(shp_file)):
+        return pd.read_csv(csv_file, engine="python")
+    geo_df = import_shapefile(filename)
+    attributes = pd.DataFrame(geo_df.drop(columns="geometry"))
+    attributes.to_csv(csv_file, index=False)
+    return attributes
+
+
 def convert_to_web_mercator(geo_df, cols=["geometry"]):
+    from fiona.crs import from_epsg
     # convert to mercator
     web_mercator_proj = geo_df.copy()
     for col in cols:
@@ -68,21 +89,24 @@ def getPoly_xy(row, coord_type, cols="geometry"):
         # Get the y coordinates of the exterior
         return list(exterior.coords.xy[1])
 
-def setup_plot(name=None, alpha=1):
+def setup_plot(name=None, alpha=1, build=False):
+    """
+    build: bool
+        Bring the shapefiles up to date first. Only stages whose inputs have
+        changed are rebuilt, see TVMsetup.build. Off by default, so plotting
+        never rewrites the shapefiles, run TVMsetup.setup for that.
+    """
+    import TVMsetup
+    from bokeh.models import ColumnDataSource
+    if build:
+        TVMsetup.build()
     # import geospatial data in web mercator
     uk_polygons = convert_to_web_mercator(
             TVMsetup.get_country_natural_earth()[0])
-    try:
-        uk_parkrun_points = convert_to_web_mercator(
-                import_shapefile("uk_parkruns"))
-        uk_parkrun_areas = convert_to_web_mercator(
-                import_shapefile("uk_parkrun_areas"))
-    except:
-        TVMsetup.setup()
-        uk_parkrun_points = convert_to_web_mercator(
-                import_shapefile("uk_parkruns"))
-        uk_parkrun_areas = convert_to_web_mercator(
-                import_shapefile("uk_parkrun_areas"))
+    uk_parkrun_points = convert_to_web_mercator(
+            import_shapefile("uk_parkruns"))
+    uk_parkrun_areas = convert_to_web_mercator(
+            import_shapefile("uk_parkrun_areas"))
 
     # create colour column
     uk_parkrun_areas["colour"] = 0
@@ -96,10 +120,9 @@ def setup_plot(name=None, alpha=1):
         else:
             raise NameError(
                     "Unrecognised name type, must be single str or list")
-        for index, row in uk_parkrun_areas.iterrows():
-            if (uk_parkrun_areas.loc[index, "m2"] in
-                    personal_runs_df["Event"].values):
-                uk_parkrun_areas.loc[index, "colour"] = 1 * alpha
+        completed = parkrun_names.completed_ids(personal_runs_df)
+        uk_parkrun_areas.loc[uk_parkrun_areas["id"].isin(completed),
+                             "colour"] = 1 * alpha
 
     # convert to points
 
@@ -138,6 +161,8 @@ def simple_parkrun_areas_plot():
     """
     Simple plot of assicuated parkrun areas
     """
+    import bokeh.plotting as bk
+    from bokeh.models import HoverTool
     (uk_map_csd, uk_parkrun_points, uk_parkrun_areas_cds) = setup_plot()
 
     tools = "pan, wheel_zoom, reset, hover, save"
@@ -168,6 +193,9 @@ def detailed_parkrun_areas_plot():
     """
     Detailed map of parkrun locations and associated areas
     """
+    import bokeh.plotting as bk
+    from bokeh.models import HoverTool
+    from bokeh.tile_providers import CARTODBPOSITRON_RETINA as uk
     (uk_map_csd, uk_parkrun_points, uk_parkrun_areas_cds) = setup_plot()
 
     tools = "pan, wheel_zoom, reset, hover, save"
@@ -197,64 +225,74 @@ def detailed_parkrun_areas_plot():
     return
 
 
-def personal_summary(name):
-    if name is not None:
-        if type(name) == str:
-            personal_runs_df = personal_parkrun.personal_parkrun_df(name)
-        elif type(name) == list:
-            personal_runs_df = personal_parkrun.group_parkrun(name)
-    uk_parkrun_areas = import_shapefile("uk_parkrun_areas")
-
-    uk_parkrun_areas["completed"] = 0
-
-    for index, row in uk_parkrun_areas.iterrows():
-        if (uk_parkrun_areas.loc[index, "m2"] in
-                personal_runs_df["Event"].values):
-            uk_parkrun_areas.loc[index, "completed"] = 1
-
-    uk_parkrun_areas["completed_area"] = (uk_parkrun_areas["area"]
-                                          * uk_parkrun_areas["completed"])
-    # group by region
-    grouped = uk_parkrun_areas.groupby(["r"])
-    # count number in each region
-    total_by_region = grouped["m2"].agg(["count"])
-    # sum completed in each region
-    completed_by_region = grouped["completed"].agg(["sum"])
-
-    personal_runs = personal_runs_df["Runs"].sum()
+def summary_metrics(personal_runs_df, uk_parkrun_areas, completed=None):
+    """
+    Tourism statistics of a personal_parkrun_df or group_parkrun table, as
+    numbers. See personal_summary for the formatted version.
 
-    p_index = 0
-    while (personal_runs_df["Runs"] > p_index).sum() > p_index:
-        p_index += 1
+    Input
+    -----
+    uk_parkrun_areas: DataFrame
+        attributes of the parkrun areas, see import_attributes
 
-    total_uk_runs = len(uk_parkrun_areas.index)
+    completed: set, optional
+        completed parkrun ids, matched from the Event column if not given
 
-    total_london_runs = total_by_region["count"][10]
+    Returns
+    -------
+    dict of total_runs, different_runs, p_index, tourist_ratio, uk_runs,
+    percent_uk_runs, percent_uk_area, london_runs, percent_london_runs
+    """
+    if completed is None:
+        completed = parkrun_names.completed_ids(personal_runs_df)
+    done = uk_parkrun_areas["id"].isin(completed).values
+    area = uk_parkrun_areas["area"].values
+    london = (uk_parkrun_areas["r"] == 10).values
+
+    runs = personal_runs_df["Runs"].values
+    personal_runs = int(runs.sum())
+    # largest p with p events each run at least p times
+    runs = np.sort(runs)[::-1]
+    p_index = int((runs >= np.arange(1, len(runs) + 1)).sum())
 
     different_personal_runs = len(personal_runs_df["Event"])
+    personal_uk_runs = int(done.sum())
+    personal_london_runs = int((done & london).sum())
+
+    return {"total_runs": personal_runs,
+            "different_runs": different_personal_runs,
+            "p_index": p_index,
+            "tourist_ratio": np.divide(different_personal_runs,
+                                       personal_runs),
+            "uk_runs": personal_uk_runs,
+            "percent_uk_runs": personal_uk_runs / len(done) * 100,
+            "percent_uk_area": area[done].sum() / area.sum() * 100,
+            "london_runs": personal_london_runs,
+            "percent_london_runs": (personal_london_runs / london.sum()
+                                    * 100)}
 
-    tourist_ratio = np.divide(different_personal_runs, personal_runs)
-
-    personal_uk_runs = uk_parkrun_areas["completed"].sum()
-
-    personal_london_runs = completed_by_region["sum"][10]
-
-    percent_uk_runs = (personal_uk_runs / total_uk_runs)*100
 
-    percent_uk_area = ((uk_parkrun_areas["completed_area"].sum()
-                        / uk_parkrun_areas["area"].sum())
-                        * 100)
-    percent_london_runs = (personal_london_runs / total_london_runs)*100
-
-    personal_runs_str = "Total runs: {:d}".format(personal_runs)
-    different_runs_str = "Different runs: {:d}".format(different_personal_runs)
-    p_index_str = "p-index: {:d}".format(p_index)
-    tourist_ratio_str = "Tourist ratio: {:0.2f}".format(tourist_ratio)
+def personal_summary(name):
+    if name is not None:
+        if type(name) == str:
+            personal_runs_df = personal_parkrun.personal_parkrun_df(name)
+        elif type(name) == list:
+            personal_runs_df = personal_parkrun.group_parkrun(name)
+    uk_parkrun_areas = import_attributes("uk_parkrun_areas")
+    metrics = summary_metrics(personal_runs_df, uk_parkrun_areas)
+
+    personal_runs_str = "Total runs: {:d}".format(metrics["total_runs"])
+    different_runs_str = "Different runs: {:d}".format(
+            metrics["different_runs"])
+    p_index_str = "p-index: {:d}".format(metrics["p_index"])
+    tourist_ratio_str = "Tourist ratio: {:0.2f}".format(
+            metrics["tourist_ratio"])
     uk_runs_str = "Different UK runs: {:d} ({:0.2f} %)".format(
-            personal_uk_runs, percent_uk_runs)
-    percent_uk_area_str = "UK area covered: {:0.2f} %".format(percent_uk_area)
+            metrics["uk_runs"], metrics["percent_uk_runs"])
+    percent_uk_area_str = "UK area covered: {:0.2f} %".format(
+            metrics["percent_uk_area"])
     london_runs_str = "Lon-done: {:d} ({:0.2f} %)".format(
-            personal_london_runs, percent_london_runs)
+            metrics["london_runs"], metrics["percent_london_runs"])
 
     print(personal_runs_str)
     print(different_runs_str)
@@ -270,6 +308,7 @@ def personal_summary(name):
 
 
 def add_personal_details(plot, name):
+    from bokeh.models import Label
 
     (personal_runs_str, different_runs_str, p_index_str, tourist_ratio_str,
      uk_runs_str, percent_uk_area_str,
@@ -325,6 +364,8 @@ def simple_personal_plot(name="scot", details=True):
     """
     Simple plot of areas, coloured based on athletes completion.
     """
+    import bokeh.plotting as bk
+    from bokeh.models import HoverTool
     (uk_map_csd, uk_parkrun_points, uk_parkrun_areas_cds) = setup_plot(name)
 
     tools = "pan, wheel_zoom, reset, hover, save"
@@ -362,6 +403,9 @@ def detailed_personal_plot(name="scot"):
     Detailed map of parkrun locations and associated areas, coloured based on
     athletes completion
     """
+    import bokeh.plotting as bk
+    from bokeh.models import HoverTool
+    from bokeh.tile_providers import CARTODBPOSITRON_RETINA as uk
     (uk_map_csd, uk_parkrun_points,
      uk_parkrun_areas_cds) = setup_plot(name, alpha=0.65)
 
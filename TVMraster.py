@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Tourist Voronoi Map
+Raster
+
+Headless static PNG maps of parkrun tourism, without bokeh or a browser.
+
+The areas layer is rasterized once into a label image, where each pixel holds
+the index of the parkrun area it falls in, and cached next to the
+shapefiles. Each athlete's map is then just a palette lookup on the label
+image.
+
+Created on Mon Oct 19 17:46:08 2026
+"""
+
+from os import path
+import os
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+import personal_parkrun
+import parkrun_names
+
+__version__ = 2.0
+
+shapefile_folder = path.normpath("shapefiles")
+map_output_folder = path.normpath("maps")
+
+# palette, matching the bokeh simple area maps
+sea_colour = (255, 255, 255)
+land_colour = (239, 224, 204)  # "#b06600" at 0.2 alpha over white
+completed_colour = (142, 140, 19)  # "#8e8c13"
+border_colour = (0, 0, 0)
+# label image classes
+SEA, LAND, COMPLETED, BORDER = range(4)
+
+
+def mercator_y(lat):
+    """
+    Web mercator y (in degree units) of latitude, so the rasters keep the
+    same shape as the web maps
+    """
+    lat = np.radians(np.clip(lat, -85, 85))
+    return np.degrees(np.log(np.tan(np.pi / 4 + lat / 2)))
+
+
+def _polygons(geometry):
+    if geometry is None or geometry.is_empty:
+        return []
+    if geometry.geom_type == "Polygon":
+        return [geometry]
+    return [geom for geom in geometry.geoms if geom.geom_type == "Polygon"]
+
+
+def rasterize_areas(areas, width=1000, margin=10):
+    """
+    Rasterizes the parkrun areas into a label image
+
+    Input
+    -----
+    areas: GeoDataFrame
+        parkrun areas in WGS84 (decimal degrees), with an "id" column
+
+    width: int
+        image width in pixels, the height follows from the map shape
+
+    Returns
+    -------
+    labels: 2D int array
+        0 for sea, i + 1 for a pixel in areas row i, len(areas) + 1 for
+        borders
+    ids: array
+        parkrun id of each areas row
+    """
+    min_lon, min_lat, max_lon, max_lat = areas.total_bounds
+    min_y, max_y = mercator_y(min_lat), mercator_y(max_lat)
+    scale = (width - 2 * margin) / (max_lon - min_lon)
+    height = int(np.ceil((max_y - min_y) * scale)) + 2 * margin
+
+    def to_pixels(coords):
+        coords = np.asarray(coords)
+        x = margin + (coords[:, 0] - min_lon) * scale
+        y = margin + (max_y - mercator_y(coords[:, 1])) * scale
+        return list(zip(x.tolist(), y.tolist()))
+
+    border = len(areas) + 1
+    image = Image.new("I", (width, height), 0)
+    draw = ImageDraw.Draw(image)
+    rings = []
+    for label, geometry in enumerate(areas["geometry"], 1):
+        for poly in _polygons(geometry):
+            exterior = to_pixels(poly.exterior.coords)
+            # each polygon is drawn with its holes into a mask of its own
+            # bounds, so a hole doesn't wipe out an area drawn earlier
+            # inside it
+            x, y = zip(*exterior)
+            left, top = int(np.floor(min(x))), int(np.floor(min(y)))
+            mask = Image.new("1", (int(np.ceil(max(x))) - left + 1,
+                                   int(np.ceil(max(y))) - top + 1), 0)
+            mask_draw = ImageDraw.Draw(mask)
+            mask_draw.polygon([(px - left, py - top) for px, py in exterior],
+                              fill=1)
+            for interior in poly.interiors:
+                mask_draw.polygon([(px - left, py - top) for px, py
+                                   in to_pixels(interior.coords)], fill=0)
+            image.paste(label, (left, top), mask)
+            rings.append(exterior)
+    # borders last, so neighbouring fills don't cover them
+    for ring in rings:
+        draw.line(ring, fill=border, width=1)
+
+    labels = np.asarray(image, dtype=np.int32)
+    return labels, np.asarray(areas["id"])
+
+
+def raster_filepath(filename="uk_parkrun_areas", width=1000):
+    return path.join(shapefile_folder,
+                     "{}_raster_{:d}.npz".format(filename, width))
+
+
+def area_labels(filename="uk_parkrun_areas", width=1000, force=False):
+    """
+    Cached label image of the parkrun areas, rasterized again if the areas
+    shapefile is newer than the cache, or if force.
+
+    Returns
+    -------
+    labels, ids as rasterize_areas
+    """
+    cache = raster_filepath(filename, width)
+    shp_file = path.join(shapefile_folder, filename + ".shp")
+    if not force and path.exists(cache) and (
+            not path.exists(shp_file)
+            or path.getmtime(cache) >= path.getmtime(shp_file)):
+        cached = np.load(cache)
+        return cached["labels"], cached["ids"]
+
+    import geopandas as gpd
+    areas = gpd.read_file(shp_file)
+    labels, ids = rasterize_areas(areas, width=width)
+    np.savez_compressed(cache, labels=labels, ids=ids)
+    return labels, ids
+
+
+def completion_classes(labels, ids, completed):
+    """
+    Image of SEA/LAND/COMPLETED/BORDER classes for a set of completed parkrun
+    ids, by a lookup on the label image
+    """
+    lookup = np.full(len(ids) + 2, LAND, dtype=np.uint8)
+    lookup[0] = SEA
+    lookup[-1] = BORDER
+    lookup[1:-1][np.isin(ids, list(completed))] = COMPLETED
+    return lookup[labels]
+
+
+def save_png(classes, filepath, text=None):
+    """
+    Saves a class image as a palette PNG, with optional lines of text in the
+    bottom left corner
+    """
+    image = Image.fromarray(classes, mode="P")
+    image.putpalette(list(sea_colour + land_colour + completed_colour
+                          + border_colour))
+    if text:
+        draw = ImageDraw.Draw(image)
+        line_height = 14
+        y = image.size[1] - line_height * (len(text) + 1)
+        for line in text:
+            draw.text((20, y), line, fill=BORDER)
+            y += line_height
+    image.save(filepath)
+    return filepath
+
+
+def personal_png(name="scot", labels=None, ids=None, width=1000,
+                 details=False):
+    """
+    Static PNG of parkrun areas, coloured based on athletes completion.
+
+    Input
+    -----
+    name: str or list
+        athlete name, or list of names for a group
+
+    labels, ids:
+        label image from area_labels, loaded if not given
+
+    details: bool
+        add the personal_summary text. Slower, as it reads the areas
+        shapefile.
+
+    Output
+    ------
+    maps/<name>_pr_tourism_map.png
+    """
+    if labels is None:
+        labels, ids = area_labels(width=width)
+    if type(name) == str:
+        personal_runs_df = personal_parkrun.personal_parkrun_df(name)
+    elif type(name) == list:
+        personal_runs_df = personal_parkrun.group_parkrun(name)
+    else:
+        raise NameError("Unrecognised name type, must be single str or list")
+    completed = parkrun_names.completed_ids(personal_runs_df)
+
+    text = None
+    if details:
+        import TVMplotting
+        text = list(TVMplotting.personal_summary(name))
+    if type(name) == list:
+        name = "Group"
+    if text is not None:
+        text.insert(0, name.title())
+
+    if not path.exists(map_output_folder):
+        os.makedirs(map_output_folder)
+    filepath = path.join(map_output_folder,
+                         path.normpath(name + "_pr_tourism_map.png"))
+    return save_png(completion_classes(labels, ids, completed), filepath,
+                    text=text)
+
+
+def batch_pngs(names, width=1000, details=False):
+    """
+    Static PNGs for many athletes, sharing one label image
+
+    Returns
+    -------
+    list of output file paths
+    """
+    labels, ids = area_labels(width=width)
+    return [personal_png(name, labels=labels, ids=ids, details=details)
+            for name in names]
+
+
+def growth_pngs(name="scot", dates=None, width=1000):
+    """
+    Static PNG of completion at each of a list of dates, as frames for an
+    animated tourism growth map. Needs a dated run log, see
+    personal_parkrun.personal_runlog_df.
+
+    dates: list of dates, optional
+        frame dates, the end of each year and the last run by default
+
+    Returns
+    -------
+    list of output file paths, maps/<name>_growth_<date>.png
+    """
+    import tourism_history
+    labels, ids = area_labels(width=width)
+    visits = tourism_history.tourism_history(name).first_visits()
+    visits = visits.assign(id=parkrun_names.match_events(visits["Event"]))
+    last = visits["Date"].max()
+    if dates is None:
+        dates = [pd.Timestamp(year, 12, 31)
+                 for year in sorted(visits["Date"].dt.year.unique())]
+        dates = [date for date in dates if date < last] + [last]
+    if type(name) == list:
+        name = "Group"
+    if not path.exists(map_output_folder):
+        os.makedirs(map_output_folder)
+    filepaths = []
+    for date in pd.to_datetime(dates):
+        completed = visits.loc[visits["Date"] <= date, "id"]
+        filepath = path.join(map_output_folder, path.normpath(
+                "{}_growth_{:%Y-%m-%d}.png".format(name, date)))
+        filepaths.append(save_png(
+                completion_classes(labels, ids, set(completed)), filepath,
+                text=["{} {:%d %b %Y}".format(name.title(), date)]))
+    return filepaths
+
+
+if __name__ == "__main__":
+    batch_pngs(["scot", "hayleigh"], details=True)
+    pass
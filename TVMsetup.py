@@ -14,8 +14,14 @@ import pandas as pd
 import geopandas as gpd
 from fiona.crs import from_epsg
 from shapely.geometry import Point, LineString, Polygon, MultiPolygon
+from shapely.ops import nearest_points, snap, unary_union
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 import cartopy.io.shapereader as csh
 from VoronoiMapping import voronoi_polygons
+import nearest_parkrun
+import build_cache
+import parkrun_names
 from lxml import html, etree
 
 __version__ = 2.0
@@ -135,6 +141,10 @@ def create_parkrun_point_shp(filename="uk_parkruns", new_XML = True):
 
     # save to geopackage file
     parkruns_geo.to_file(output_GPKG)
+
+    # nearest parkrun lookup and name matching indexes, saved alongside
+    nearest_parkrun.build_index(parkruns_geo, filename=filename)
+    parkrun_names.build_index(parkruns_geo, filename=filename)
     return parkruns_geo
 
 
@@ -152,8 +162,7 @@ def get_country_natural_earth_new(country_code=["GBR"]):
     ------
     geodataframe of all polygons making up the country in WGS84 projection
     """
-    shpfilename = csh.natural_earth(resolution='10m', category='cultural',
-                                    name='admin_0_countries')
+    shpfilename = natural_earth_file()
 
     all_countries_gdf = gpd.read_file(shpfilename)
 
@@ -190,8 +199,7 @@ def get_country_natural_earth(country_code="GBR"):
     ------
     geodataframe of all polygons making up the country in WGS84 projection
     """
-    shpfilename = csh.natural_earth(resolution='10m', category='cultural',
-                                    name='admin_0_countries')
+    shpfilename = natural_earth_file()
 
     all_countries_gdf = gpd.read_file(shpfilename)
 
@@ -208,9 +216,225 @@ def get_country_natural_earth(country_code="GBR"):
     return country_gdf, country_gdf_multi
 
 
+def locate_on_islands(points, islands, nudge=1e-6):
+    """
+    Finds the island containing each point, snapping points which fall off
+    the coastline onto the nearest island.
+
+    Uses a bounding box prefilter and prepared island geometries, so each
+    point is only fully tested against the few islands around it.
+
+    Input
+    -----
+    points: list of shapely Points
+
+    islands: list of shapely Polygons
+
+    nudge: float
+        distance (decimal degrees) snapped points are moved past the
+        coastline, so they fall inside the island
+
+    Returns
+    -------
+    (island index of each point, points on their island, number snapped)
+    """
+    bounds = np.array([island.bounds for island in islands])
+    prepared = [prep(island) for island in islands]
+    xy = np.array([(point.x, point.y) for point in points])
+    in_bounds = ((xy[:, None, 0] >= bounds[None, :, 0])
+                 & (xy[:, None, 1] >= bounds[None, :, 1])
+                 & (xy[:, None, 0] <= bounds[None, :, 2])
+                 & (xy[:, None, 1] <= bounds[None, :, 3]))
+
+    island_index = np.full(len(points), -1, dtype=int)
+    land_points = list(points)
+    for i, point in enumerate(points):
+        for j in np.flatnonzero(in_bounds[i]):
+            if prepared[j].contains(point):
+                island_index[i] = j
+                break
+
+    offshore = np.flatnonzero(island_index < 0)
+    for i in offshore:
+        point = points[i]
+        distances = [island.distance(point) for island in islands]
+        j = int(np.argmin(distances))
+        coast = nearest_points(islands[j], point)[0]
+        # carry on past the coast, into the island
+        step = np.array([coast.x - point.x, coast.y - point.y])
+        step = step / max(np.linalg.norm(step), 1e-12) * nudge
+        inland = Point(coast.x + step[0], coast.y + step[1])
+        island_index[i] = j
+        land_points[i] = inland if prepared[j].contains(inland) else coast
+    return island_index, land_points, len(offshore)
+
+
+def _half_plane(point, other, size):
+    """
+    Polygon covering the side of the bisector of point and other that point
+    is on, out to size from their midpoint
+    """
+    p = np.array([point.x, point.y])
+    q = np.array([other.x, other.y])
+    mid = (p + q) / 2
+    along = (p - q) / max(np.linalg.norm(p - q), 1e-12) * size
+    across = np.array([-along[1], along[0]])
+    return Polygon([mid + across, mid + across + along,
+                    mid - across + along, mid - across])
+
+
+def carve_snapped_area(land_point, island, voronoi, land_points):
+    """
+    Area for a snapped parkrun whose voronoi cell doesn't reach its island.
+    The cell containing its snapped point is split along the bisector of
+    the snapped point and that cell's own parkrun, and the snapped side
+    cropped to the island.
+
+    Returns
+    -------
+    Polygon or MultiPolygon, None if no cell contains the snapped point
+    """
+    for cell in voronoi["geometry"]:
+        if not cell.contains(land_point):
+            continue
+        owners = [point for point in land_points
+                  if point is not land_point and cell.contains(point)]
+        piece = cell.intersection(island)
+        if owners:
+            owner = min(owners, key=land_point.distance)
+            minx, miny, maxx, maxy = cell.bounds
+            size = 2 * np.hypot(maxx - minx, maxy - miny)
+            piece = piece.intersection(_half_plane(land_point, owner, size))
+        return piece
+    return None
+
+
+def remove_carved_areas(areas, carved, land_points, ghost_areas):
+    """
+    Removes areas carved by carve_snapped_area from the neighbouring areas
+    they overlap. Any piece of a neighbour cut off from its parkrun is added
+    to ghost_areas.
+    """
+    for carved_index, carved_poly in carved:
+        for index, area in enumerate(areas["geometry"]):
+            if index == carved_index or not area.intersects(carved_poly):
+                continue
+            area = area.difference(carved_poly)
+            pieces = [area] if area.geom_type == "Polygon" else [
+                    geom for geom in getattr(area, "geoms", [])
+                    if geom.geom_type == "Polygon" and geom.area > 0]
+            if len(pieces) > 1:
+                land_point = land_points[index]
+                keep = min(pieces, key=land_point.distance)
+                ghost_areas.extend(piece for piece in pieces
+                                   if piece is not keep)
+                area = keep
+            areas.loc[areas.index[index], "geometry"] = area
+
+
+def _intersecting_pairs(query_geoms, tree_geoms):
+    """
+    (query index, tree index) arrays of every intersecting pair, using an
+    STRtree over tree_geoms
+    """
+    tree = STRtree(tree_geoms)
+    try:
+        pairs = tree.query(query_geoms, predicate="intersects")
+        return pairs[0], pairs[1]
+    except (TypeError, AttributeError):
+        # shapely < 2 queries one geometry at a time and returns geometries
+        tree_index = {id(geom): i for i, geom in enumerate(tree_geoms)}
+        query, found = [], []
+        for i, geom in enumerate(query_geoms):
+            for match in tree.query(geom):
+                if match.intersects(geom):
+                    query.append(i)
+                    found.append(tree_index[id(match)])
+        return np.array(query, dtype=int), np.array(found, dtype=int)
+
+
+def _shared_lengths(geoms_a, geoms_b, tolerance):
+    """
+    Length of border each pair of polygons share, measured as the length of
+    b's boundary within tolerance of a
+    """
+    try:
+        import shapely
+        return shapely.length(shapely.intersection(
+                shapely.buffer(np.asarray(geoms_a, dtype=object), tolerance),
+                shapely.boundary(np.asarray(geoms_b, dtype=object))))
+    except (ImportError, AttributeError):
+        return np.array([a.buffer(tolerance).intersection(b.boundary).length
+                         for a, b in zip(geoms_a, geoms_b)])
+
+
+def redistribute_ghosts(areas, ghosts, tolerance=1e-7, max_rounds=3):
+    """
+    Merges each ghost fragment (a piece of a parkrun's voronoi cell cut off
+    from its parkrun, eg by a river) into the neighbouring area it shares the
+    longest border with.
+
+    All fragments are matched to neighbours at once with an STRtree over the
+    areas, and each area is merged with all of its fragments in one union.
+    Fragments which only touch other fragments are picked up in later
+    rounds.
+
+    Input
+    -----
+    areas: list of shapely Polygons
+
+    ghosts: list of shapely Polygons
+
+    tolerance: float
+        gap (decimal degrees) still counted as a shared border
+
+    Returns
+    -------
+    (list of merged areas, list of fragments touching no area)
+    """
+    areas = list(areas)
+    ghosts = list(ghosts)
+    for i in range(max_rounds):
+        if not ghosts:
+            break
+        query = [ghost.buffer(tolerance) for ghost in ghosts]
+        ghost_index, area_index = _intersecting_pairs(query, areas)
+        if len(ghost_index) == 0:
+            break
+        lengths = _shared_lengths([ghosts[g] for g in ghost_index],
+                                  [areas[a] for a in area_index], tolerance)
+        # longest shared border for each ghost
+        order = np.lexsort((-lengths, ghost_index))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ghost_index[order][1:] != ghost_index[order][:-1]
+        best = order[first & (lengths[order] > 0)]
+
+        merged = set()
+        targets = pd.Series(ghost_index[best]).groupby(area_index[best])
+        for target, members in targets:
+            area = areas[target]
+            parts = [snap(ghosts[g], area, tolerance) for g in members]
+            union = unary_union([area] + parts)
+            if union.geom_type == "MultiPolygon":
+                # keep the area a single polygon, fragments which didn't join
+                # up stay as ghosts
+                anchor = area.representative_point()
+                union = [part for part in union.geoms
+                         if part.intersects(anchor)][0]
+            for g in members:
+                if ghosts[g].representative_point().intersects(union):
+                    merged.add(g)
+            areas[target] = union
+        if not merged:
+            break
+        ghosts = [ghost for g, ghost in enumerate(ghosts) if g not in merged]
+    return areas, ghosts
+
+
 def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
                          buffer=0.001*0.99,
-                         filename="uk_parkrun_areas"):
+                         filename="uk_parkrun_areas", snap=False,
+                         merge_ghosts=False):
     """
     Crops the raw voronoi diagram to the shape of the uk, and matches each area
     to it's corresponding parkrun.
@@ -233,6 +457,17 @@ def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
     buffer: float
         The intial distance (decimal degrees) to increase the map size by.
 
+    snap: bool
+        Instead of buffering the whole map until every parkrun is on it, snap
+        only the parkruns off the coastline to the nearest island, and crop
+        to the exact coastline. buffer is ignored.
+
+    merge_ghosts: bool
+        Merge pieces of voronoi cells cut off from their parkrun (eg by a
+        river) into the neighbouring area they share the longest border with,
+        rather than dropping them. See redistribute_ghosts. Off by default,
+        as the committed areas were made without it.
+
     Returns
     -------
     GeoDataFrame of shapely polygons for parkrun areas (decimal degrees)
@@ -248,11 +483,22 @@ def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
     # column for island index of each run
     uk_parkrun_points_areas["map_index"] = None
 
+    # points used to find the island and area piece of each run
+    land_points = list(uk_parkrun_points["geometry"])
+
     # Assign each parkrun with a uk island map index.
     # Because the current uk map resolution isn't good enough, some parkrun
     # locations are off the map. As a quick fix, using buffer to increase the
     # size of the uk. This is increased by 0.1% until all parkruns are
     # accounted for.
+    # Or with snap, move just those parkruns onto the nearest coast.
+    if snap:
+        map_index, land_points, n_snapped = locate_on_islands(
+                land_points, list(uk_geo_df["geometry"]))
+        uk_parkrun_points_areas["map_index"] = map_index
+        uk_geo_df["number"] = np.bincount(map_index,
+                                          minlength=len(uk_geo_df))
+        print("{:d} parkruns snapped to the coast".format(n_snapped))
     while (uk_geo_df["number"].sum()) < (len(uk_parkrun_points["geometry"])):
         for index, uk_area in enumerate(uk_geo_df["geometry"]):
             # because uk map isn't accurate enough to contain all coastal
@@ -271,13 +517,15 @@ def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
                     uk_parkrun_points_areas.loc[index2, "map_index"] = index
             uk_geo_df.loc[index, "number"] = len(parkrun_points)
         buffer*=1.001  # 1% increase in buffer
-    print(buffer)
+    if not snap:
+        print(buffer)
 
     # Create a new GeoDataFrame for the area polygons, as GeoDataFrame can't
     # have 2 geometry columns. Must separate points and areas.
     uk_parkrun_areas = uk_parkrun_points_areas.copy()
     cropped_areas = uk_parkrun_voronoi.copy()
     ghost_areas = []  # to collect areas separated by eg rivers from closest
+    carved = []  # (point index, area) carved out of a neighbouring cell
 
     # For each point, check if within each voronoi polygon.
     # If it is the only parkrun within that map island, set the map island as
@@ -296,15 +544,25 @@ def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
                                                         "map_index"]
                 uk_island = uk_geo_df.loc[map_index, "geometry"]
                 # is it the only parkrun for that island
+                land_point = land_points[point_index]
                 if uk_geo_df.loc[map_index, "number"] == 1:
                     # only one parkrun on an island. ie Medina IoW
                     new_poly = uk_island
                 else:
-                    if vor_poly.intersects(uk_island):
-                        # crop voronoi polygon to island coast
-                        new_poly = vor_poly.intersection(uk_island)
-                    else:
-                        print(uk_parkrun_points_areas.loc[point_index, "m"])
+                    # crop voronoi polygon to island coast, clipping once
+                    new_poly = vor_poly.intersection(uk_island)
+                if new_poly.area == 0:
+                    # a snapped parkrun whose cell doesn't reach the coast,
+                    # carve its area out of the cell its snapped point is in
+                    new_poly = carve_snapped_area(
+                            land_point, uk_island, uk_parkrun_voronoi,
+                            land_points)
+                    if new_poly is None:
+                        raise ValueError(
+                                "No area found for {}".format(
+                                    uk_parkrun_points_areas.loc[point_index,
+                                                                "m"]))
+                    carved.append((point_index, new_poly))
 
                 cropped_areas.loc[vor_poly_index, "geometry"] = new_poly
                 # might have created a multipolygon with a river for instance
@@ -313,13 +571,20 @@ def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
                 elif new_poly.geom_type == "MultiPolygon":
                     # need to deal with multiple polygons a better way.
                     largest = Point((0, 0))
-                    for polyyyy in new_poly:
+                    if not any(polyyyy.contains(land_point)
+                               for polyyyy in new_poly.geoms):
+                        # a snapped point can land just outside its cell,
+                        # use the nearest piece
+                        land_point = min(
+                                new_poly.geoms,
+                                key=land_point.distance).representative_point()
+                    for polyyyy in new_poly.geoms:
                         # could use the largest polygon area, not ideal
 #                        if abs(polyyyy.area) > abs(largest.area):
 #                            largest = polyyyy
 #                    uk_parkrun_areas.loc[point_index, "geometry"] = largest
                         # or whichever contains the parkrun location
-                        if polyyyy.contains(point):
+                        if polyyyy.contains(land_point):
                             uk_parkrun_areas.loc[point_index,
                                                  "geometry"] = polyyyy
                         else:
@@ -331,8 +596,18 @@ def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
                     raise IOError("Shape is not a polygon")
                 pass
 
+    if carved:
+        remove_carved_areas(uk_parkrun_areas, carved, land_points,
+                            ghost_areas)
+
+    if merge_ghosts and ghost_areas:
+        merged_areas, ghost_areas = redistribute_ghosts(
+                list(uk_parkrun_areas["geometry"]), ghost_areas)
+        uk_parkrun_areas["geometry"] = merged_areas
+        print("{:d} ghost areas left unmerged".format(len(ghost_areas)))
+
     # calculate the area (in decimal degrees) for each parkrun
-    uk_parkrun_areas["area"] = 0
+    uk_parkrun_areas["area"] = 0.0
     for index, row in uk_parkrun_areas.iterrows():
         uk_parkrun_areas.loc[index, "area"] = (
                 uk_parkrun_areas.loc[index, "geometry"].area)
@@ -350,24 +625,127 @@ def assign_parkrun_areas(uk_parkrun_points, uk_parkrun_voronoi, uk_map,
     return uk_parkrun_areas
 
 
-def setup():
+def natural_earth_file():
+    """
+    Path to the Natural Earth 10m countries shapefile, downloaded by cartopy
+    if needed
+    """
+    return csh.natural_earth(resolution='10m', category='cultural',
+                             name='admin_0_countries')
+
+
+# parameters that made the shapefiles committed to the repo
+committed_params = {"areas": {"spherical": False, "buffer": 0.0056,
+                              "snap": False, "merge_ghosts": False}}
+
+
+def build(spherical=False, buffer=0.0056, snap=False, merge_ghosts=False,
+          force=False):
     """
-    Run this if new parkrun location data has been downloaded
+    Builds the parkrun point and area shapefiles, stage by stage:
+    xml -> csv -> points -> areas -> render bundle.
+
+    A stage is skipped if the content of its inputs and its parameters are
+    unchanged since it last ran, see build_cache. force reruns everything.
+
+    The voronoi diagram is an intermediate of the areas stage, only built
+    when the areas are. So the committed areas are used as they are, without
+    the coastline or voronoi diagram, as long as the parkrun points and the
+    parameters are those they were made with. Use force after a new
+    Natural Earth coastline.
     """
+    points_shp = build_cache.shapefile_parts("uk_parkruns")
+    voronoi_shp = build_cache.shapefile_parts("uk_parkrun_voronoi")
+    areas_shp = build_cache.shapefile_parts("uk_parkrun_areas")
+    # existing outputs are only adopted while nothing upstream has been
+    # rebuilt in this run, and with the parameters of the committed files
+    rebuilt = False
+
     # get parkrun locations
-    uk_parkrun_points = create_parkrun_point_shp("uk_parkruns")
-    # get country polygons
-    uk_df, country_gdf_multi = get_country_natural_earth()
+    ran, _ = build_cache.run_stage(
+            "xml2csv",
+            lambda: parkrun_locs_xml2csv(geo_doc="parkrun_geo.xml",
+                                         country_code=97),
+            inputs=["parkrun_geo.xml"],
+            outputs=["world_parkruns.csv", "uk_parkruns.csv"],
+            params={"country_code": 97}, force=force, adopt=True)
+    rebuilt |= ran
+    ran, _ = build_cache.run_stage(
+            "points",
+            lambda: create_parkrun_point_shp("uk_parkruns", new_XML=False),
+            inputs=["uk_parkruns.csv"], outputs=points_shp, force=force,
+            adopt=not rebuilt)
+    rebuilt |= ran
+
     # create a voronoi object
-    uk_parkruns_voronoi = voronoi_polygons(uk_parkrun_points,
-                                           country_gdf_multi)
-    uk_parkrun_areas = assign_parkrun_areas(uk_parkrun_points,
-                                            uk_parkruns_voronoi, uk_df,
-                                            buffer=0.0056,
-                                            filename="uk_parkrun_areas")
+    def voronoi_stage():
+        country_gdf_multi = get_country_natural_earth()[1]
+        uk_parkruns_voronoi = voronoi_polygons(
+                import_shapefile("uk_parkruns"), country_gdf_multi,
+                spherical=spherical)
+        uk_parkruns_voronoi.to_file(voronoi_shp[0])
+
+    # crop to the coast and match to parkruns
+    def areas_stage():
+        build_cache.run_stage(
+                "voronoi", voronoi_stage,
+                inputs=points_shp + [natural_earth_file()],
+                outputs=voronoi_shp, params={"spherical": spherical},
+                force=force)
+        uk_df = get_country_natural_earth()[0]
+        return assign_parkrun_areas(import_shapefile("uk_parkruns"),
+                                    import_shapefile("uk_parkrun_voronoi"),
+                                    uk_df, buffer=buffer,
+                                    filename="uk_parkrun_areas", snap=snap,
+                                    merge_ghosts=merge_ghosts)
+    # keyed on the points rather than the voronoi diagram made from them,
+    # and not on the coastline, as finding it can mean downloading it
+    params = {"spherical": spherical, "buffer": buffer, "snap": snap,
+              "merge_ghosts": merge_ghosts}
+    ran, uk_parkrun_areas = build_cache.run_stage(
+            "areas", areas_stage, inputs=points_shp, outputs=areas_shp,
+            params=params, force=force,
+            adopt=not rebuilt and params == committed_params["areas"])
+    rebuilt |= ran
+
+    # attribute table for summaries and label image for static maps
+    import TVMplotting
+    import TVMraster
+
+    def render_stage():
+        # the stage only runs when the areas have changed, so skip the
+        # helpers' own mtime caches
+        TVMplotting.import_attributes("uk_parkrun_areas", force=True)
+        TVMraster.area_labels("uk_parkrun_areas", force=True)
+    build_cache.run_stage(
+            "render", render_stage, inputs=areas_shp,
+            outputs=[path.join(shapefile_folder, "uk_parkrun_areas.csv"),
+                     TVMraster.raster_filepath("uk_parkrun_areas")],
+            force=force, adopt=not rebuilt)
 
     return uk_parkrun_areas
 
+
+def setup(spherical=False, buffer=0.0056, snap=False, merge_ghosts=False,
+          force=False):
+    """
+    Run this if new parkrun location data has been downloaded. Only the
+    stages affected by changed inputs are rebuilt, see build.
+
+    spherical: bool
+        Build the voronoi diagram on the sphere rather than on lon/lat degrees
+
+    snap: bool
+        Snap offshore parkruns to the coast rather than buffering the map,
+        see assign_parkrun_areas
+    """
+    uk_parkrun_areas = build(spherical=spherical, buffer=buffer, snap=snap,
+                             merge_ghosts=merge_ghosts, force=force)
+    if uk_parkrun_areas is None:
+        uk_parkrun_areas = import_shapefile("uk_parkrun_areas")
+    return uk_parkrun_areas
+
+
 if __name__ == "__main__":
     uk, uk2 = get_country_natural_earth()
     # run setup to regenerate UK parkrun veroni map
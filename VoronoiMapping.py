@@ -6,17 +6,26 @@ Created on Fri Sep 15 11:45:13 2017
 @author: Scot Wheeler
 """
 
+from itertools import chain
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.spatial import Voronoi
-from shapely.geometry import Polygon
+from scipy.spatial import Voronoi, SphericalVoronoi
+from shapely.geometry import Polygon, box
+from shapely.affinity import translate
+from shapely.ops import unary_union
 import geopandas as gpd
 from fiona.crs import from_epsg
+try:
+    from shapely import (linearrings as _shapely_linearrings,
+                         polygons as _shapely_polygons)
+except ImportError:
+    _shapely_linearrings = _shapely_polygons = None
 
 __version__ = 2.0
 
 
-def voronoi_polygons(points_df, overall_map):
+def voronoi_polygons(points_df, overall_map=None, spherical=False,
+                     max_edge=1.0):
     """
     Creates a voronoi map of the points, to fill entirety of overall_map
     Polygons need cropping seperately.
@@ -26,9 +35,28 @@ def voronoi_polygons(points_df, overall_map):
         Geodataframe of points only
 
     overall_map
-        Geodataframe of polygons forming a country only
+        Geodataframe of polygons forming a country only. Not needed in
+        spherical mode.
+
+    spherical : bool
+        Build the diagram on the sphere, using great circle distances, rather
+        than on raw lon/lat degrees. Use this for world scale areas, where the
+        planar diagram is distorted at high latitudes and breaks across the
+        antimeridian. The cells cover the whole globe.
+
+    max_edge : float
+        Spherical mode only. Longest straight segment (degrees of arc) used to
+        draw a cell edge, as great circle edges are curved in lon/lat.
 
     """
+    if spherical:
+        polys = spherical_voronoi_polygons(points_df["lo"].values,
+                                           points_df["la"].values,
+                                           max_edge=max_edge)
+        polygons = gpd.GeoDataFrame({"geometry": polys})
+        polygons.crs = from_epsg(4326)  # WGS84 (decimal degrees)
+        return polygons
+
     bbox = overall_map["geometry"][0].bounds
     # use hypotenuse to ensure distance to infinite points is outside uk.
     max_bound = np.sqrt((bbox[2]-bbox[0])**2 + (bbox[3]-bbox[1])**2)
@@ -41,6 +69,122 @@ def voronoi_polygons(points_df, overall_map):
     return polygons
 
 
+def lonlat_to_xyz(lon, lat):
+    """
+    Converts decimal degree lon/lat arrays to (N, 3) unit vectors
+    """
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    return np.column_stack([np.cos(lat) * np.cos(lon),
+                            np.cos(lat) * np.sin(lon),
+                            np.sin(lat)])
+
+
+def xyz_to_lonlat(xyz):
+    """
+    Converts (N, 3) vectors to decimal degree lon, lat arrays
+    """
+    xyz = xyz / np.linalg.norm(xyz, axis=1)[:, None]
+    lon = np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0]))
+    lat = np.degrees(np.arcsin(np.clip(xyz[:, 2], -1, 1)))
+    return lon, lat
+
+
+def spherical_voronoi_polygons(lon, lat, max_edge=1.0):
+    """
+    Voronoi cells on the unit sphere, as lon/lat polygons.
+
+    Cell edges are great circle arcs, drawn with segments no longer than
+    max_edge degrees. Cells crossing the antimeridian are split into a
+    MultiPolygon at +/-180, and the two cells holding the poles are closed
+    along the pole.
+
+    Input
+    -----
+    lon, lat : arrays
+        Generator locations in decimal degrees. Must not contain duplicates.
+
+    Returns
+    -------
+    list of shapely polygons, one per generator in input order
+    """
+    xyz = lonlat_to_xyz(lon, lat)
+    n_points = len(xyz)
+    sv = SphericalVoronoi(xyz, radius=1)
+    sv.sort_vertices_of_regions()
+
+    # flatten regions into vertex/offset arrays
+    lengths = np.fromiter((len(r) for r in sv.regions), dtype=np.intp,
+                          count=n_points)
+    flat = np.fromiter(chain.from_iterable(sv.regions), dtype=np.intp,
+                       count=lengths.sum())
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    ring_start = np.repeat(offsets[:-1], lengths)
+    ring_len = np.repeat(lengths, lengths)
+    following = ring_start + (np.arange(len(flat)) - ring_start + 1) % ring_len
+
+    # densify every edge along its great circle. Normalising the straight
+    # line between the ends keeps the points on the arc.
+    start = sv.vertices[flat]
+    end = sv.vertices[flat[following]]
+    arc = np.degrees(np.arccos(np.clip(np.einsum("ij,ij->i", start, end),
+                                       -1, 1)))
+    # near the poles short arcs sweep through a lot of longitude, and are
+    # strongly curved in lon/lat, so count that too
+    sweep = np.diff(np.stack([xyz_to_lonlat(start)[0],
+                              xyz_to_lonlat(end)[0]]), axis=0)[0]
+    sweep = np.abs(sweep - 360 * np.round(sweep / 360))
+    steps = np.ceil(np.maximum(arc, sweep) / max_edge)
+    steps = np.maximum(1, steps).astype(np.intp)
+    edge = np.repeat(np.arange(len(flat)), steps)
+    t = (np.arange(len(edge)) - np.repeat(np.cumsum(steps) - steps, steps)
+         ) / steps[edge]
+    ring_xyz = (1 - t)[:, None] * start[edge] + t[:, None] * end[edge]
+    ring_lengths = np.add.reduceat(steps, offsets[:-1])
+    ring_offsets = np.concatenate([[0], np.cumsum(ring_lengths)])
+    ring_lon, ring_lat = xyz_to_lonlat(ring_xyz)
+
+    # unwrap longitude along each ring, so rings crossing the antimeridian
+    # are continuous and run past +/-180
+    step_lon = np.diff(ring_lon, prepend=ring_lon[0])
+    step_lon[ring_offsets[:-1]] = 0
+    jumps = np.cumsum(-360 * np.round(step_lon / 360))
+    jumps -= np.repeat(jumps[ring_offsets[:-1]], ring_lengths)
+    ring_lon = ring_lon + jumps
+
+    polys = polygons_from_offsets(np.column_stack([ring_lon, ring_lat]),
+                                  ring_offsets)
+
+    # the nearest generator to each pole owns it. Its unwrapped ring winds
+    # once around the pole, so close it along the pole instead.
+    for pole_index, pole_lat in [(np.argmax(xyz[:, 2]), 90),
+                                 (np.argmin(xyz[:, 2]), -90)]:
+        first = ring_offsets[pole_index]
+        last = ring_offsets[pole_index + 1] - 1
+        closing = ring_lon[first] - ring_lon[last]
+        closing -= 360 * np.round(closing / 360)
+        winding = np.round((ring_lon[last] + closing - ring_lon[first]) / 360)
+        if winding == 0:
+            continue
+        ring = np.column_stack([ring_lon[first:last + 1],
+                                ring_lat[first:last + 1]]).tolist()
+        end_lon = ring_lon[first] + 360 * winding
+        ring += [[end_lon, ring_lat[first]], [end_lon, pole_lat],
+                 [ring_lon[first], pole_lat]]
+        polys[pole_index] = Polygon(ring)
+
+    # split anything outside -180 to 180 at the antimeridian
+    bounds = np.array([poly.bounds for poly in polys])
+    crossing = np.flatnonzero((bounds[:, 0] < -180) | (bounds[:, 2] > 180))
+    world = box(-180, -90, 180, 90)
+    for index in crossing:
+        pieces = [translate(polys[index], xoff=shift).intersection(world)
+                  for shift in (-360, 0, 360)]
+        polys[index] = unary_union([piece for piece in pieces
+                                    if not piece.is_empty])
+    return polys
+
+
 def voronoi_finite_polygons_2d(vor, radius=None):
     """
     Reconstruct infinite voronoi regions in a 2D diagram to finite
@@ -55,85 +199,104 @@ def voronoi_finite_polygons_2d(vor, radius=None):
 
     Returns
     -------
-    polygons : a geodataframe of voronoi polygons
-    regions : list of tuples
-        Indices of vertices in each revised Voronoi regions.
-    vertices : list of tuples
-        Coordinates for revised Voronoi vertices. Same as coordinates
-        of input vertices, with 'points at infinity' appended to the
-        end.
+    polygons : a geodataframe of voronoi polygons, one per input point in
+        input order
 
     """
 
     if vor.points.shape[1] != 2:
         raise ValueError("Requires 2D input")
 
-    new_regions = []
-    new_vertices = vor.vertices.tolist()
-
-    center = vor.points.mean(axis=0)
-    if radius is None:
-        radius = vor.points.ptp().max()
-
-    # Construct a map containing all ridges for a given point
-    all_ridges = {}
-    for (p1, p2), (v1, v2) in zip(vor.ridge_points, vor.ridge_vertices):
-        all_ridges.setdefault(p1, []).append((p2, v1, v2))
-        all_ridges.setdefault(p2, []).append((p1, v1, v2))
+    vertices, offsets = finite_voronoi_regions(vor, radius=radius)
+    polys = polygons_from_offsets(vertices, offsets)
 
-    # Reconstruct infinite regions
-    for p1, region in enumerate(vor.point_region):
-        vertices = vor.regions[region]
+    # create geodataframe
+    polygons = gpd.GeoDataFrame({"geometry": polys})
+    polygons.crs = from_epsg(4326)  # change to WGS84 (decimal degrees)
 
-        if all(v >= 0 for v in vertices):
-            # finite region
-            new_regions.append(vertices)
-            continue
+    return polygons
 
-        # reconstruct a non-finite region
-        ridges = all_ridges[p1]
-        new_region = [v for v in vertices if v >= 0]
 
-        for p2, v1, v2 in ridges:
-            if v2 < 0:
-                v1, v2 = v2, v1
-            if v1 >= 0:
-                # finite ridge: already in the region
-                continue
+def finite_voronoi_regions(vor, radius=None):
+    """
+    Flat vertex/offset form of the finite voronoi regions, one region per
+    input point in input order. Each infinite ridge is closed with a single
+    'point at infinity', computed for all ridges at once and shared by the
+    two regions either side of it.
 
-            # Compute the missing endpoint of an infinite ridge
+    Returns
+    -------
+    vertices : (N, 2) array
+        Region vertices, counterclockwise within each region
+    offsets : (n_points + 1,) array
+        Region i is vertices[offsets[i]:offsets[i + 1]]
+    """
+    points = vor.points
+    n_points = len(points)
 
-            t = vor.points[p2] - vor.points[p1] # tangent
-            t /= np.linalg.norm(t)
-            n = np.array([-t[1], t[0]])  # normal
+    center = points.mean(axis=0)
+    if radius is None:
+        radius = np.ptp(points)
 
-            midpoint = vor.points[[p1, p2]].mean(axis=0)
-            direction = np.sign(np.dot(midpoint - center, n)) * n
-            far_point = vor.vertices[v2] + direction * radius
+    # far point for every infinite ridge. The direction doesn't depend on
+    # which side of the ridge it's seen from, so both regions share it.
+    ridge_points = np.asarray(vor.ridge_points)
+    ridge_vertices = np.asarray(vor.ridge_vertices)
+    infinite = (ridge_vertices < 0).any(axis=1)
+    inf_points = ridge_points[infinite]
+    finite_end = ridge_vertices[infinite].max(axis=1)
 
-            new_region.append(len(new_vertices))
-            new_vertices.append(far_point.tolist())
+    t = points[inf_points[:, 1]] - points[inf_points[:, 0]]  # tangent
+    t /= np.linalg.norm(t, axis=1)[:, None]
+    n = np.column_stack([-t[:, 1], t[:, 0]])  # normal
+    midpoint = points[inf_points].mean(axis=1)
+    side = np.sign(np.einsum("ij,ij->i", midpoint - center, n))
+    direction = side[:, None] * n
+    far_points = vor.vertices[finite_end] + direction * radius
 
-        # sort region counterclockwise
-        vs = np.asarray([new_vertices[v] for v in new_region])
-        c = vs.mean(axis=0)
-        angles = np.arctan2(vs[:, 1] - c[1], vs[:, 0] - c[0])
-        new_region = np.array(new_region)[np.argsort(angles)]
+    # flatten the qhull regions into (owner point, vertex) pairs, dropping
+    # the -1 infinite vertex
+    regions = [vor.regions[r] for r in vor.point_region]
+    lengths = np.fromiter((len(r) for r in regions), dtype=np.intp,
+                          count=n_points)
+    region_vertices = np.fromiter(chain.from_iterable(regions),
+                                  dtype=np.intp, count=lengths.sum())
+    region_owners = np.repeat(np.arange(n_points), lengths)
+    keep = region_vertices >= 0
 
-        # finish
-        new_regions.append(new_region.tolist())
+    # far points belong to the regions of both ridge points
+    all_vertices = np.concatenate([vor.vertices, far_points])
+    far_index = len(vor.vertices) + np.arange(len(far_points))
+    owners = np.concatenate([region_owners[keep], inf_points[:, 0],
+                             inf_points[:, 1]])
+    vertex_index = np.concatenate([region_vertices[keep], far_index,
+                                   far_index])
+    coords = all_vertices[vertex_index]
 
-    regions = new_regions
+    # sort each region counterclockwise about its vertex mean; regions are
+    # convex so this orders the finite regions as well
+    counts = np.bincount(owners, minlength=n_points)
+    centres = np.column_stack(
+            [np.bincount(owners, weights=coords[:, 0], minlength=n_points),
+             np.bincount(owners, weights=coords[:, 1], minlength=n_points)]
+            ) / counts[:, None]
+    offset_xy = coords - centres[owners]
+    angles = np.arctan2(offset_xy[:, 1], offset_xy[:, 0])
+    order = np.lexsort((angles, owners))
 
-    vertices = np.asarray(new_vertices)
-    polys = []
-    for region in regions:
-        polygon = vertices[region]
-        poly = Polygon(polygon)
-        polys.append(poly)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return coords[order], offsets
 
-    # create geodataframe
-    polygons = gpd.GeoDataFrame({"geometry": polys})
-    polygons.crs = from_epsg(4326)  # change to WGS84 (decimal degrees)
 
-    return polygons
+def polygons_from_offsets(vertices, offsets):
+    """
+    Builds a list of shapely polygons from flat vertex/offset arrays, where
+    polygon i is vertices[offsets[i]:offsets[i + 1]].
+    """
+    offsets = np.asarray(offsets)
+    if _shapely_polygons is not None:
+        indices = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        rings = _shapely_linearrings(vertices, indices=indices)
+        return list(_shapely_polygons(rings))
+    # shapely < 2 has no bulk constructor
+    return [Polygon(ring) for ring in np.split(vertices, offsets[1:-1])]
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Build cache
+Created on Mon Oct 19 17:49:13 2026
+
+Make-like cache for the pipeline stages in TVMsetup.setup. Each stage is
+keyed by a hash of the content of its input files and its parameters. The
+key is recorded in a manifest when the stage runs, and the stage is skipped
+next time if its key is unchanged and its outputs still exist. A stage with
+no record is built, unless it's told to adopt existing outputs, which is
+only safe for files known to come from the same inputs and parameters (eg
+the shapefiles committed to the repo).
+"""
+
+import hashlib
+import json
+from os import path
+
+__version__ = 2.0
+
+shapefile_folder = path.normpath("shapefiles")
+manifest_file = path.join(shapefile_folder, "build_manifest.json")
+
+
+def shapefile_parts(filename):
+    """
+    The files holding a shapefile's geometry and attributes
+    """
+    if filename[-4:] == ".shp":
+        filename = filename[:-4]
+    filepath = path.join(shapefile_folder, filename)
+    return [filepath + ext for ext in [".shp", ".shx", ".dbf"]]
+
+
+def file_hash(filepath, block_size=2**20):
+    """
+    sha256 of a file's content, "missing" if it doesn't exist
+    """
+    if not path.exists(filepath):
+        return "missing"
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def stage_key(stage, inputs=(), params=None):
+    """
+    Hash of the stage name, input file contents and parameters
+    """
+    sha = hashlib.sha256(stage.encode())
+    for filepath in inputs:
+        sha.update(path.basename(filepath).encode())
+        sha.update(file_hash(filepath).encode())
+    sha.update(json.dumps(params or {}, sort_keys=True,
+                          default=str).encode())
+    return sha.hexdigest()
+
+
+def load_manifest():
+    if path.exists(manifest_file):
+        with open(manifest_file) as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest):
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def run_stage(stage, func, inputs=(), outputs=(), params=None, force=False,
+              adopt=False):
+    """
+    Runs func() unless the stage is current.
+
+    Input
+    -----
+    stage: str
+        stage name in the manifest
+
+    func: callable
+        builds the outputs from the inputs, called with no arguments
+
+    inputs, outputs: lists of file paths
+
+    params: dict
+        json serialisable parameters that change the outputs
+
+    force: bool
+        run even if current
+
+    adopt: bool
+        if the stage has no record, record existing outputs as current
+        instead of building them
+
+    Returns
+    -------
+    (ran, result): whether func ran, and its return value (None if skipped)
+    """
+    key = stage_key(stage, inputs, params)
+    record = load_manifest().get(stage)
+    outputs_exist = all(path.exists(output) for output in outputs)
+    current = record["key"] == key if record is not None else adopt
+    if not force and outputs_exist and current:
+        if record is None:
+            _record(stage, key, inputs, outputs, params)
+        print("{}: up to date".format(stage))
+        return False, None
+
+    print("{}: building".format(stage))
+    result = func()
+    _record(stage, key, inputs, outputs, params)
+    return True, result
+
+
+def _record(stage, key, inputs, outputs, params):
+    manifest = load_manifest()
+    manifest[stage] = {"key": key, "inputs": list(inputs),
+                       "outputs": list(outputs), "params": params or {}}
+    save_manifest(manifest)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk summary
+Created on Mon Oct 19 17:58:53 2026
+
+Exports the personal_summary statistics of many athletes as a table, one
+row per athlete. Athletes are split into chunks, summarised on a process
+pool, and each chunk is written to the output file as soon as it finishes,
+so memory stays flat however many athletes there are. Each worker loads the
+areas table and name index once, and matches the event names of a whole
+chunk in one call.
+
+Output is CSV, or Parquet (needs pyarrow) if the file ends in .parquet.
+"""
+
+import glob
+import multiprocessing
+import os
+import time
+from os import path
+import numpy as np
+import pandas as pd
+import personal_parkrun
+import parkrun_names
+import TVMplotting
+
+__version__ = 2.0
+
+user_folder = path.normpath("user")
+map_output_folder = path.normpath("maps")
+
+columns = ["name", "total_runs", "different_runs", "p_index",
+           "tourist_ratio", "uk_runs", "percent_uk_runs", "percent_uk_area",
+           "london_runs", "percent_london_runs"]
+dtypes = {"name": object, "total_runs": np.int64,
+          "different_runs": np.int64, "p_index": np.int64,
+          "tourist_ratio": np.float64, "uk_runs": np.int64,
+          "percent_uk_runs": np.float64, "percent_uk_area": np.float64,
+          "london_runs": np.int64, "percent_london_runs": np.float64}
+
+# loaded once in each worker process, see _init_worker
+_areas = None
+_name_index = None
+
+
+def athlete_names():
+    """
+    Names of every athlete with a parkrun history in user/
+    """
+    files = sorted(glob.glob(path.join(user_folder, "*_parkruns.csv")))
+    return [path.basename(f)[:-len("_parkruns.csv")] for f in files]
+
+
+def _init_worker(areas_filename="uk_parkrun_areas"):
+    global _areas, _name_index
+    _areas = TVMplotting.import_attributes(areas_filename)
+    _name_index = parkrun_names.load_index()
+
+
+def summarise_chunk(names):
+    """
+    Summary row of each athlete in names
+
+    Returns
+    -------
+    (rows, failed): DataFrame of summary rows, and list of (name, error) of
+    athletes that couldn't be summarised, including those with no parkruns
+    """
+    if _areas is None:
+        _init_worker()
+    histories, failed = [], []
+    for i, name in enumerate(names):
+        try:
+            history = personal_parkrun.personal_parkrun_df(name)
+        except Exception as error:
+            failed.append((name, str(error)))
+            continue
+        if len(history) == 0:
+            failed.append((name, "No parkruns in history"))
+        else:
+            histories.append(history.assign(athlete=i))
+    rows = []
+    if histories:
+        runs = pd.concat(histories, ignore_index=True)
+        # fuzzy matches aren't saved here, as workers would race to write
+        # the index
+        runs["id"] = _name_index.match(runs["Event"].values)
+        # grouped by position, so every athlete gets a row even if a name
+        # is given twice
+        for i, history in runs.groupby("athlete", sort=False):
+            ids = history["id"].values
+            metrics = TVMplotting.summary_metrics(
+                    history, _areas, completed=set(ids[ids >= 0].tolist()))
+            metrics["name"] = names[i]
+            rows.append(metrics)
+    rows = pd.DataFrame(rows, columns=columns)
+    return rows.astype(dtypes), failed
+
+
+class _Writer(object):
+    """
+    Appends chunks of rows to a CSV or Parquet file
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.parquet = filepath.endswith(".parquet")
+        self.writer = None
+        self.started = False
+        if self.parquet:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError("Parquet output needs pyarrow, use a .csv "
+                                  "file instead")
+        if path.exists(filepath):
+            os.remove(filepath)
+
+    def schema(self):
+        import pyarrow as pa
+        types = {np.int64: pa.int64(), np.float64: pa.float64(),
+                 object: pa.string()}
+        return pa.schema([(col, types[dtypes[col]]) for col in columns])
+
+    def write(self, rows):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = self.schema()
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.filepath, schema)
+            self.writer.write_table(pa.Table.from_pandas(
+                    rows, schema=schema, preserve_index=False))
+        else:
+            rows.to_csv(self.filepath, mode="a", index=False,
+                        header=not self.started)
+        self.started = True
+
+    def close(self):
+        if self.started:
+            if self.writer is not None:
+                self.writer.close()
+            return
+        # no rows, write an empty file with the column types
+        if self.parquet:
+            import pyarrow.parquet as pq
+            pq.ParquetWriter(self.filepath, self.schema()).close()
+        else:
+            pd.DataFrame(columns=columns).to_csv(self.filepath, index=False)
+        self.started = True
+
+
+def _chunks(names, chunk_size):
+    for start in range(0, len(names), chunk_size):
+        yield names[start:start + chunk_size]
+
+
+def export_summaries(names=None, filepath=None, chunk_size=100,
+                     processes=None, report_seconds=5):
+    """
+    Writes the summary statistics of every athlete to a file.
+
+    Input
+    -----
+    names: list of str, optional
+        athletes to summarise, everyone in user/ by default
+
+    filepath: str
+        output CSV, or .parquet file. maps/athlete_summaries.csv by default
+
+    chunk_size: int
+        athletes per task. Rows are written a chunk at a time.
+
+    processes: int
+        worker processes, the number of CPUs by default. 1 runs in this
+        process.
+
+    report_seconds: float
+        how often to print progress
+
+    Returns
+    -------
+    dict with the number of athletes written, failed, seconds and
+    athletes_per_second
+    """
+    if names is None:
+        names = athlete_names()
+    if filepath is None:
+        filepath = path.join(map_output_folder, "athlete_summaries.csv")
+    out_folder = path.dirname(filepath)
+    if out_folder and not path.exists(out_folder):
+        os.makedirs(out_folder)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, -(-len(names) // chunk_size)))
+
+    # build or refresh the name index once, before the workers load it
+    parkrun_names.load_index()
+    writer = _Writer(filepath)
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker)
+        results = pool.imap_unordered(summarise_chunk,
+                                      _chunks(names, chunk_size))
+    else:
+        _init_worker()
+        results = map(summarise_chunk, _chunks(names, chunk_size))
+
+    start = time.perf_counter()
+    last_report = start
+    done, failed = 0, []
+    try:
+        for rows, chunk_failed in results:
+            if len(rows):
+                writer.write(rows)
+            done += len(rows) + len(chunk_failed)
+            failed.extend(chunk_failed)
+            now = time.perf_counter()
+            if now - last_report >= report_seconds or done == len(names):
+                print("{:d}/{:d} athletes, {:0.1f} athletes/s".format(
+                        done, len(names), done / (now - start)))
+                last_report = now
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    seconds = time.perf_counter() - start
+    for name, error in failed:
+        print("Failed {}: {}".format(name, error))
+    return {"athletes": done - len(failed), "failed": len(failed),
+            "seconds": seconds,
+            "athletes_per_second": done / seconds if seconds else np.nan}
+
+
+if __name__ == "__main__":
+    export_summaries()
+    pass
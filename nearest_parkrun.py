@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Nearest parkrun
+Created on Mon Oct 19 17:43:48 2026
+
+Answers "which parkrun is closest" for batches of coordinates without
+scanning the voronoi areas. Parkrun points are held in a KD-tree of unit
+vectors, so straight line (chord) distances order the same as great circle
+distances, and the tree is saved next to the shapefiles.
+"""
+
+import pickle
+from os import path
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+__version__ = 2.0
+
+shapefile_folder = path.normpath("shapefiles")
+
+earth_radius_km = 6371.0088
+
+
+def lonlat_to_xyz(lon, lat):
+    """
+    Converts decimal degree lon/lat to (N, 3) unit vectors
+    """
+    lon = np.radians(np.atleast_1d(np.asarray(lon, dtype=float)))
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=float)))
+    return np.column_stack([np.cos(lat) * np.cos(lon),
+                            np.cos(lat) * np.sin(lon),
+                            np.sin(lat)])
+
+
+def chord_to_km(chord):
+    return earth_radius_km * 2 * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(km / earth_radius_km, np.pi) / 2)
+
+
+class ParkrunIndex(object):
+    """
+    KD-tree index of parkrun point locations.
+
+    Input
+    -----
+    parkrun_points: DataFrame
+        Parkrun points with "id", "lo", "la" and "m2" (or "m") columns, such
+        as the output of TVMsetup.create_parkrun_point_shp
+    """
+
+    def __init__(self, parkrun_points):
+        names = "m2" if "m2" in parkrun_points else "m"
+        self.ids = np.asarray(parkrun_points["id"])
+        self.names = np.asarray(parkrun_points[names])
+        self.lon = np.asarray(parkrun_points["lo"], dtype=float)
+        self.lat = np.asarray(parkrun_points["la"], dtype=float)
+        self.tree = cKDTree(lonlat_to_xyz(self.lon, self.lat))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, lon, lat, k=1):
+        """
+        The k nearest parkruns to each coordinate
+
+        Returns
+        -------
+        (distance_km, index) arrays of shape (n, k), nearest first. index
+        refers to rows of the index, use ids[index] or names[index].
+        """
+        k = min(k, len(self))
+        chord, index = self.tree.query(lonlat_to_xyz(lon, lat), k=k)
+        chord = np.asarray(chord).reshape(-1, k)
+        index = np.asarray(index).reshape(-1, k)
+        return chord_to_km(chord), index
+
+    def within(self, lon, lat, radius_km):
+        """
+        All parkruns within radius_km of each coordinate
+
+        Returns
+        -------
+        list with an array of row indices for each coordinate
+        """
+        return self.tree.query_ball_point(lonlat_to_xyz(lon, lat),
+                                          km_to_chord(radius_km))
+
+    def count_within(self, lon, lat, radius_km):
+        """
+        Number of parkruns within radius_km of each coordinate
+        """
+        return self.tree.query_ball_point(lonlat_to_xyz(lon, lat),
+                                          km_to_chord(radius_km),
+                                          return_length=True)
+
+    def home_parkruns(self, lon, lat, radius_km=None):
+        """
+        Home (nearest) parkrun for each coordinate, eg geocoded member
+        postcodes.
+
+        Returns
+        -------
+        DataFrame with the id, name and distance of the home parkrun, and if
+        radius_km is given the number of parkruns within it
+        """
+        distance, index = self.nearest(lon, lat, k=1)
+        index = index[:, 0]
+        homes = pd.DataFrame({"id": self.ids[index],
+                              "m2": self.names[index],
+                              "distance_km": distance[:, 0]})
+        if radius_km is not None:
+            homes["within"] = self.count_within(lon, lat, radius_km)
+        return homes
+
+    def coverage(self, lon, lat, radius_km=5):
+        """
+        Local coverage statistics for a set of coordinates
+
+        Returns
+        -------
+        (homes, summary): the home_parkruns DataFrame, and a per parkrun
+        summary of how many coordinates call it home and their median
+        distance to it
+        """
+        homes = self.home_parkruns(lon, lat, radius_km=radius_km)
+        summary = homes.groupby(["id", "m2"])["distance_km"].agg(
+                ["count", "median"])
+        summary = summary.sort_values("count", ascending=False)
+        print("Within {:g} km of a parkrun: {:0.2f} %".format(
+                radius_km, (homes["within"] > 0).mean() * 100))
+        print("Median distance to home parkrun: {:0.2f} km".format(
+                homes["distance_km"].median()))
+        return homes, summary
+
+
+def index_filepath(filename="uk_parkruns"):
+    if filename[-4:] == ".shp":
+        filename = filename[:-4]
+    return path.join(shapefile_folder, filename + "_index.pkl")
+
+
+def build_index(parkrun_points=None, filename="uk_parkruns"):
+    """
+    Builds the parkrun index and saves it next to the shapefiles
+
+    Input
+    -----
+    parkrun_points: GeoDataFrame, optional
+        Parkrun points. If None, the filename shapefile is imported.
+    """
+    if parkrun_points is None:
+        import geopandas as gpd
+        shp = filename if filename[-4:] == ".shp" else filename + ".shp"
+        parkrun_points = gpd.read_file(path.join(shapefile_folder, shp))
+    index = ParkrunIndex(parkrun_points)
+    with open(index_filepath(filename), "wb") as f:
+        # save the attributes rather than the class, so the file loads the
+        # same whichever module built it
+        pickle.dump(vars(index), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return index
+
+
+def load_index(filename="uk_parkruns"):
+    """
+    Loads the saved parkrun index, rebuilding it if it's missing or older
+    than the points shapefile
+    """
+    index_file = index_filepath(filename)
+    shp = filename if filename[-4:] == ".shp" else filename + ".shp"
+    shp_file = path.join(shapefile_folder, shp)
+    if path.exists(index_file) and (
+            not path.exists(shp_file)
+            or path.getmtime(index_file) >= path.getmtime(shp_file)):
+        index = ParkrunIndex.__new__(ParkrunIndex)
+        with open(index_file, "rb") as f:
+            vars(index).update(pickle.load(f))
+        return index
+    return build_index(filename=filename)
+
+
+def home_parkruns(lon, lat, radius_km=None, filename="uk_parkruns"):
+    """
+    Home parkrun for each coordinate, using the saved index
+    """
+    return load_index(filename).home_parkruns(lon, lat, radius_km=radius_km)
+
+
+if __name__ == "__main__":
+    index = load_index()
+    print(index.home_parkruns([-1.2577], [51.7520], radius_km=10))
+    pass
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+parkrun names
+Created on Mon Oct 19 17:44:58 2026
+
+Matches event names from athlete histories to parkrun ids. Names are reduced
+to a normalised key (lower case, no accents, punctuation or "parkrun"), and
+every parkrun is indexed under the keys of its name and its web name, then
+with "park" removed where that key is unique. Names of parkruns in other
+countries are never matched. Anything still unmatched is fuzzy matched in
+bulk against the whole key table, and the result added to the index, so
+later lookups are a dictionary hit.
+
+Renamed events can be added to aliases.csv (alias, id).
+"""
+
+import pickle
+import re
+import unicodedata
+from os import path
+import numpy as np
+import pandas as pd
+
+__version__ = 2.0
+
+shapefile_folder = path.normpath("shapefiles")
+alias_file = path.normpath("aliases.csv")
+world_file = path.normpath("world_parkruns.csv")
+
+# country code of the indexed parkruns in world_parkruns.csv
+home_country = 97
+
+# cosine similarity of character trigrams needed for a fuzzy match
+fuzzy_threshold = 0.8
+# and how much it must beat the best match to any other parkrun by
+fuzzy_margin = 0.1
+
+_word = re.compile(r"[a-z0-9]+")
+
+
+def name_words(name):
+    """
+    Lower case ascii words of an event name, without "parkrun" or anything
+    after a comma
+    """
+    name = unicodedata.normalize("NFKD", str(name))
+    name = name.encode("ascii", "ignore").decode().lower()
+    name = name.split(",")[0].replace("&", " and ")
+    return [word for word in _word.findall(name) if word != "parkrun"]
+
+
+def normalise_name(name, strip_park=True):
+    """
+    Normalised matching key for an event name, eg
+    "Medina I.O.W. parkrun" -> "medinaiow", "Bushy Park" -> "bushy", or
+    "bushypark" if not strip_park
+    """
+    words = name_words(name)
+    if strip_park:
+        words = [word for word in words if word != "park"]
+    return "".join(words)
+
+
+def normalise_names(names, strip_park=True):
+    """
+    Normalised keys for a sequence of names, computed once per unique name
+    """
+    names = pd.Series(names, dtype=object)
+    unique = names.unique()
+    keys = dict(zip(unique, (normalise_name(name, strip_park)
+                             for name in unique)))
+    return names.map(keys).values
+
+
+def _is_suffixed(words, key):
+    """
+    Whether the words are key with extra words on the end, eg a country or
+    state ("Mansfield OH" and "mansfield")
+    """
+    return any("".join(words[:end]) == key for end in range(1, len(words)))
+
+
+def _trigrams(keys, vocabulary):
+    """
+    Sparse, row normalised, character trigram counts of keys. New trigrams
+    are added to vocabulary.
+    """
+    # only needed for fuzzy matching, so kept out of the summary start up
+    from scipy import sparse
+    rows, cols = [], []
+    for row, key in enumerate(keys):
+        padded = " " + key + " "
+        for i in range(len(padded) - 2):
+            cols.append(vocabulary.setdefault(padded[i:i + 3],
+                                              len(vocabulary)))
+            rows.append(row)
+    counts = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(len(keys), max(len(vocabulary), 1)))
+    norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ counts
+
+
+class NameIndex(object):
+    """
+    Normalised name -> parkrun id index
+
+    Full names (keeping "park") are indexed first, then names without
+    "park", unless that would give one key to several parkruns (eg "Preston"
+    and "Preston Park"). Those are listed in ambiguous.
+
+    Input
+    -----
+    parkrun_points: DataFrame
+        Parkrun points with "id", "m" and optionally "m2" and "n" columns,
+        such as the output of TVMsetup.create_parkrun_point_shp
+
+    aliases: DataFrame, optional
+        Extra "alias", "id" pairs, eg the old names of renamed events
+
+    overseas: sequence of str, optional
+        Names of parkruns outside the index, eg the rest of
+        world_parkruns.csv. These are never matched.
+    """
+
+    def __init__(self, parkrun_points, aliases=None, overseas=None):
+        ids = np.asarray(parkrun_points["id"])
+        # earlier sources win when two events share a key
+        full = [(parkrun_points["m"], ids)]
+        if "n" in parkrun_points:
+            full.append((parkrun_points["n"], ids))
+        if aliases is not None and len(aliases):
+            full.insert(0, (aliases["alias"], np.asarray(aliases["id"])))
+        stripped = list(full)
+        if "m2" in parkrun_points:
+            stripped.append((parkrun_points["m2"], ids))
+
+        self.keys = {}
+        for names, name_ids in full:
+            for key, parkrun_id in zip(normalise_names(names, False),
+                                       name_ids):
+                if key:
+                    self.keys.setdefault(key, int(parkrun_id))
+        stripped_ids = {}
+        for names, name_ids in stripped:
+            for key, parkrun_id in zip(normalise_names(names), name_ids):
+                if key and key not in self.keys:
+                    stripped_ids.setdefault(key, set()).add(int(parkrun_id))
+        self.ambiguous = {}
+        for key, key_ids in stripped_ids.items():
+            if len(key_ids) == 1:
+                self.keys[key] = key_ids.pop()
+            else:
+                self.ambiguous[key] = sorted(key_ids)
+
+        self.overseas = set()
+        if overseas is not None:
+            for strip_park in [False, True]:
+                self.overseas.update(
+                        key for key in normalise_names(overseas, strip_park)
+                        if key and key not in self.keys)
+        self.fuzzy = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, name):
+        """
+        parkrun id of a name by exact key, -1 for an overseas parkrun, None
+        if not found
+        """
+        full = normalise_name(name, strip_park=False)
+        stripped = normalise_name(name)
+        for key in [full, stripped]:
+            if key in self.keys:
+                return self.keys[key]
+            if key in self.overseas:
+                return -1
+        return None
+
+    def match(self, names, fuzzy=True):
+        """
+        parkrun id for each name, -1 if there's no match
+
+        Input
+        -----
+        names: sequence of str
+            Event names, eg the Event column of personal_parkrun_df
+
+        fuzzy: bool
+            Fuzzy match names with no exact key match. Matches are added to
+            the index.
+        """
+        names = pd.Series(names, dtype=object)
+        unique = names.unique()
+        found = {name: self.lookup(name) for name in unique}
+        unmatched = [name for name, parkrun_id in found.items()
+                     if parkrun_id is None]
+        if fuzzy and unmatched:
+            self.add_fuzzy(unmatched)
+            found.update({name: self.lookup(name) for name in unmatched})
+        return np.array([-1 if found[name] is None else found[name]
+                         for name in names], dtype=int)
+
+    def add_fuzzy(self, names):
+        """
+        Fuzzy matches names against the whole key table at once, adding
+        those over the fuzzy_threshold, and fuzzy_margin ahead of any other
+        parkrun, to the index. Names that are a key with extra words on the
+        end (eg a country) aren't matched.
+        """
+        names = {normalise_name(name, strip_park=False): name
+                 for name in names}
+        names = {key: name for key, name in names.items()
+                 if key and key not in self.fuzzy}
+        if not names:
+            return
+        keys = list(names)
+        table = list(self.keys)
+        table_ids = np.array([self.keys[key] for key in table])
+        vocabulary = {}
+        table_grams = _trigrams(table, vocabulary)
+        key_grams = _trigrams([normalise_name(names[key]) for key in keys],
+                              vocabulary)
+        table_grams.resize(len(table), len(vocabulary))
+        similarity = (key_grams @ table_grams.T).toarray()
+        for key, scores in zip(keys, similarity):
+            best = int(scores.argmax())
+            others = scores[table_ids != table_ids[best]]
+            runner_up = others.max() if len(others) else 0
+            words = name_words(names[key])
+            suffixed = (
+                    _is_suffixed(words, table[best])
+                    or _is_suffixed([word for word in words
+                                     if word != "park"], table[best]))
+            if (scores[best] >= fuzzy_threshold
+                    and scores[best] - runner_up >= fuzzy_margin
+                    and not suffixed):
+                self.keys[key] = self.keys[table[best]]
+                self.fuzzy[key] = table[best]
+            else:
+                # remember misses too, so they're not retried
+                self.fuzzy[key] = None
+
+
+def index_filepath(filename="uk_parkruns"):
+    if filename[-4:] == ".shp":
+        filename = filename[:-4]
+    return path.join(shapefile_folder, filename + "_names.pkl")
+
+
+def _read_csv(filepath):
+    try:
+        return pd.read_csv(filepath, engine="python")
+    except UnicodeDecodeError:
+        # older csv files were saved as latin-1
+        return pd.read_csv(filepath, engine="python", encoding="latin-1")
+
+
+def load_aliases():
+    if path.exists(alias_file):
+        return _read_csv(alias_file)
+    return None
+
+
+def load_overseas():
+    """
+    Names of the parkruns outside home_country in world_parkruns.csv
+    """
+    if path.exists(world_file):
+        world = _read_csv(world_file)
+        return world.loc[world["c"] != home_country, "m"].values
+    return None
+
+
+def build_index(parkrun_points=None, filename="uk_parkruns"):
+    """
+    Builds the name index and saves it next to the shapefiles
+
+    Input
+    -----
+    parkrun_points: GeoDataFrame, optional
+        Parkrun points. If None, the filename shapefile is imported.
+    """
+    if parkrun_points is None:
+        import geopandas as gpd
+        shp = filename if filename[-4:] == ".shp" else filename + ".shp"
+        parkrun_points = gpd.read_file(path.join(shapefile_folder, shp))
+    index = NameIndex(parkrun_points, aliases=load_aliases(),
+                      overseas=load_overseas())
+    if index.ambiguous:
+        print("Not indexed without park, as shared by several parkruns: "
+              "{}".format(", ".join(sorted(index.ambiguous))))
+    save_index(index, filename)
+    return index
+
+
+def save_index(index, filename="uk_parkruns"):
+    with open(index_filepath(filename), "wb") as f:
+        pickle.dump(vars(index), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_index(filename="uk_parkruns"):
+    """
+    Loads the saved name index, rebuilding it if it's missing or older than
+    the points shapefile or aliases
+    """
+    index_file = index_filepath(filename)
+    shp = filename if filename[-4:] == ".shp" else filename + ".shp"
+    sources = [path.join(shapefile_folder, shp), alias_file, world_file]
+    if path.exists(index_file) and all(
+            path.getmtime(index_file) >= path.getmtime(source)
+            for source in sources if path.exists(source)):
+        index = NameIndex.__new__(NameIndex)
+        with open(index_file, "rb") as f:
+            vars(index).update(pickle.load(f))
+        # indexes saved by older versions are rebuilt
+        if all(hasattr(index, attribute)
+               for attribute in ["keys", "ambiguous", "overseas", "fuzzy"]):
+            return index
+    return build_index(filename=filename)
+
+
+def match_events(names, filename="uk_parkruns", fuzzy=True):
+    """
+    parkrun id for each event name, -1 if there's no match. New fuzzy matches
+    are saved to the index.
+    """
+    index = load_index(filename)
+    n_fuzzy = len(index.fuzzy)
+    ids = index.match(names, fuzzy=fuzzy)
+    if len(index.fuzzy) != n_fuzzy:
+        save_index(index, filename)
+    return ids
+
+
+def completed_ids(personal_runs_df, filename="uk_parkruns"):
+    """
+    Set of parkrun ids completed in a personal_parkrun_df or group_parkrun
+    table
+    """
+    ids = match_events(personal_runs_df["Event"].values, filename=filename)
+    return set(ids[ids >= 0].tolist())
+
+
+if __name__ == "__main__":
+    import personal_parkrun
+    scot = personal_parkrun.personal_parkrun_df("scot")
+    scot["id"] = match_events(scot["Event"])
+    print(scot)
+    pass
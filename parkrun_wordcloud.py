@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+parkrun word cloud
+Created on Mon Oct 19 17:57:04 2026
+
+Word cloud of how often each event has been run, as in
+docs/parkrun_wordcloud.png, from the user/ histories of any set of athletes.
+
+The histories are parsed into one table, saved in user/ with the hash of
+each file, and only new or changed files are parsed again. Run counts per
+event are then a single groupby over the table. The PNG and frequency table
+are build_cache stages keyed by the hashes of the histories used, and drawn
+with PIL, so no display or word cloud package is needed.
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+from os import path
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+import build_cache
+import personal_parkrun
+
+__version__ = 2.0
+
+user_folder = path.normpath("user")
+map_output_folder = path.normpath("maps")
+history_table_file = path.join(user_folder, "history_table.pkl")
+
+# same colours as the area maps
+colours = ["#8e8c13", "#b06600"]
+font_file = "DejaVuSansMono.ttf"
+
+
+def history_files(names=None):
+    """
+    Paths of the parkrun histories of names, or of every athlete in user/
+    """
+    if names is None:
+        return sorted(glob.glob(path.join(user_folder, "*_parkruns.csv")))
+    return [path.join(user_folder, path.normpath(name + "_parkruns.csv"))
+            for name in names]
+
+
+def _athlete(filepath):
+    return path.basename(filepath)[:-len("_parkruns.csv")]
+
+
+def history_table(files):
+    """
+    Event and Runs of every history in files, with the athlete of each row.
+
+    The table is saved with the hash of each file it was built from, and
+    only files with a new hash are parsed.
+
+    Returns
+    -------
+    (table, hashes): the table, and dict of file path -> hash
+    """
+    hashes = {filepath: build_cache.file_hash(filepath) for filepath in files}
+    missing = [f for f, file_hash in hashes.items() if file_hash == "missing"]
+    if missing:
+        raise IOError("User parkrun file not found: {}".format(
+                ", ".join(missing)))
+
+    saved_hashes, table = {}, None
+    if path.exists(history_table_file):
+        with open(history_table_file, "rb") as f:
+            saved = pickle.load(f)
+        saved_hashes, table = saved["hashes"], saved["table"]
+
+    athletes = {_athlete(filepath): filepath for filepath in files}
+    changed = [athlete for athlete, filepath in athletes.items()
+               if saved_hashes.get(filepath) != hashes[filepath]]
+    if changed:
+        parsed = [personal_parkrun.personal_parkrun_df(athlete).assign(
+                athlete=athlete) for athlete in changed]
+        if table is not None:
+            parsed.insert(0, table[~table["athlete"].isin(changed)])
+        table = pd.concat(parsed, ignore_index=True)
+        saved_hashes.update({athletes[athlete]: hashes[athletes[athlete]]
+                             for athlete in changed})
+        with open(history_table_file, "wb") as f:
+            pickle.dump({"hashes": saved_hashes, "table": table}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    if table is None:
+        table = pd.DataFrame({"Event": pd.Series(dtype=object),
+                              "Runs": pd.Series(dtype=np.int64),
+                              "athlete": pd.Series(dtype=object)})
+    table = table[table["athlete"].isin(list(athletes))]
+    return table, hashes
+
+
+def event_frequency(table):
+    """
+    Total runs and number of athletes at each event, most run first
+    """
+    frequency = table.groupby("Event").agg(runs=("Runs", "sum"),
+                                           athletes=("athlete", "nunique"))
+    frequency = frequency.sort_values("runs", ascending=False,
+                                      kind="mergesort")
+    return frequency.reset_index()
+
+
+def _font(size):
+    try:
+        return ImageFont.truetype(font_file, size)
+    except IOError:
+        return ImageFont.load_default(size)
+
+
+def _summed_area(occupied):
+    table = np.zeros((occupied.shape[0] + 1, occupied.shape[1] + 1),
+                     dtype=np.int32)
+    np.cumsum(occupied, axis=0, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+def _free_positions(table, box_height, box_width):
+    """
+    Top left corners where a box_height x box_width box covers no occupied
+    pixels, from the summed area table of the occupied image
+    """
+    covered = (table[box_height:, box_width:] - table[:-box_height, box_width:]
+               - table[box_height:, :-box_width]
+               + table[:-box_height, :-box_width])
+    return covered == 0
+
+
+def render_wordcloud(frequency, filepath, width=1000, height=1000,
+                     max_words=200, max_font=200, min_font=10, mask=None,
+                     margin=4, seed=0, cell=4):
+    """
+    Draws a word cloud of event run counts to a PNG.
+
+    Words are placed largest first, each at the free position nearest the
+    centre, and turned vertical if they only fit that way. Words that don't
+    fit at min_font are left out.
+
+    Free space is searched on a grid of cell x cell pixel blocks, a block
+    being taken if any pixel in it is drawn on, so each search costs
+    1 / cell**2 of a pixel search. A word size that didn't fit isn't tried
+    again for later words.
+
+    Input
+    -----
+    frequency: DataFrame
+        Event and runs columns, most run first, see event_frequency
+
+    mask: 2D bool array, optional
+        height x width, True where words may be drawn
+
+    Returns
+    -------
+    filepath
+    """
+    frequency = frequency.head(max_words)
+    rows, cols = -(-height // cell), -(-width // cell)
+    # pixels, padded to whole blocks, True where drawn on or masked out
+    occupied = np.ones((rows * cell, cols * cell), dtype=bool)
+    occupied[:height, :width] = False
+    if mask is not None:
+        occupied[:height, :width] |= ~np.asarray(mask, dtype=bool)
+    blocks = occupied.reshape(rows, cell, cols, cell).any(axis=(1, 3))
+    image = Image.new("RGB", (width, height), "white")
+    rng = np.random.RandomState(seed)
+    y, x = np.ogrid[0:rows, 0:cols]
+    centre = (y - rows / 2) ** 2 + (x - cols / 2) ** 2
+    failed = []  # (rows, cols) of block sizes that didn't fit
+
+    top_runs = frequency["runs"].max()
+    for event, runs in zip(frequency["Event"], frequency["runs"]):
+        size = int(max_font * np.sqrt(runs / top_runs))
+        table = _summed_area(blocks)
+        placed = False
+        while size >= min_font and not placed:
+            font = _font(size)
+            left, top, right, bottom = font.getbbox(event)
+            text = Image.new("L", (right + 2 * margin, bottom + 2 * margin))
+            ImageDraw.Draw(text).text((margin, margin), event, fill=255,
+                                      font=font)
+            for rotate in [False, True]:
+                word = text.rotate(90, expand=True) if rotate else text
+                box_rows = -(-word.size[1] // cell)
+                box_cols = -(-word.size[0] // cell)
+                if box_rows >= rows or box_cols >= cols or any(
+                        box_rows >= fail_rows and box_cols >= fail_cols
+                        for fail_rows, fail_cols in failed):
+                    continue
+                free = _free_positions(table, box_rows, box_cols)
+                if not free.any():
+                    failed.append((box_rows, box_cols))
+                    continue
+                # distance of each box centre from the image centre
+                box_centre = centre[box_rows // 2:
+                                    box_rows // 2 + free.shape[0],
+                                    box_cols // 2:
+                                    box_cols // 2 + free.shape[1]]
+                top_block, left_block = np.unravel_index(
+                        np.argmin(np.where(free, box_centre, np.inf)),
+                        free.shape)
+                top_pixel, left_pixel = top_block * cell, left_block * cell
+                image.paste(colours[rng.randint(len(colours))],
+                            (int(left_pixel), int(top_pixel)), word)
+                word_rows, word_cols = word.size[1], word.size[0]
+                occupied[top_pixel:top_pixel + word_rows,
+                         left_pixel:left_pixel + word_cols] |= (
+                        np.asarray(word) > 0)
+                region = occupied[top_block * cell:
+                                  (top_block + box_rows) * cell,
+                                  left_block * cell:
+                                  (left_block + box_cols) * cell]
+                blocks[top_block:top_block + box_rows,
+                       left_block:left_block + box_cols] = region.reshape(
+                        box_rows, cell, box_cols, cell).any(axis=(1, 3))
+                placed = True
+                break
+            size = int(size * 0.8)
+
+    image.save(filepath)
+    return filepath
+
+
+def wordcloud(names=None, filepath=None, force=False, **kwargs):
+    """
+    Word cloud of the events run by names (list of athletes), or by every
+    athlete in user/. Skipped if the histories haven't changed since the
+    last time.
+
+    Output
+    ------
+    maps/parkrun_wordcloud.png and the frequency table beside it
+
+    Returns
+    -------
+    frequency DataFrame, see event_frequency
+    """
+    if filepath is None:
+        filepath = path.join(map_output_folder, "parkrun_wordcloud.png")
+    frequency_file = filepath[:-4] + ".csv"
+    out_folder = path.dirname(filepath)
+    if out_folder and not path.exists(out_folder):
+        os.makedirs(out_folder)
+
+    table, hashes = history_table(history_files(names))
+    histories = hashlib.sha256("".join(
+            "{}{}".format(path.basename(f), h)
+            for f, h in sorted(hashes.items())).encode()).hexdigest()
+    params = {"histories": histories}
+    params.update({key: value for key, value in kwargs.items()
+                   if key != "mask"})
+    if kwargs.get("mask") is not None:
+        params["mask"] = hashlib.sha256(
+                np.packbits(kwargs["mask"]).tobytes()).hexdigest()
+
+    def build():
+        frequency = event_frequency(table)
+        frequency.to_csv(frequency_file, index=False)
+        render_wordcloud(frequency, filepath, **kwargs)
+        return frequency
+
+    ran, frequency = build_cache.run_stage(
+            "wordcloud " + filepath, build,
+            outputs=[filepath, frequency_file], params=params, force=force)
+    if not ran:
+        frequency = pd.read_csv(frequency_file, engine="python")
+    return frequency
+
+
+if __name__ == "__main__":
+    print(wordcloud().head(20))
+    pass
@@ -34,18 +34,44 @@ def personal_parkrun_df(name):
     # remove nan events
     personal_parkruns.dropna(inplace=True)
 
-    for index, row in personal_parkruns.iterrows():
-        event = personal_parkruns.loc[index, "Event"]
-        # remove word parkrun
-        event = event.replace(" parkrun", "")
-        if "," in event:
-            comma = event.index(",")
-            event = event[:comma]
-
-        personal_parkruns.loc[index, "Event"] = event
+    personal_parkruns["Event"] = clean_event_names(
+            personal_parkruns["Event"])
     return personal_parkruns
 
 
+def clean_event_names(events):
+    """
+    Removes the word parkrun, and anything after a comma, from a Series of
+    event names
+    """
+    return events.str.replace(" parkrun", "", regex=False).str.split(
+            ",").str[0]
+
+
+def personal_runlog_df(name):
+    """
+    Dated run log, one row per run, sorted by date.
+
+    Use excel, data from web to import the All Results table from
+    http://www.parkrun.org.uk/results/athleteeventresultshistory/?athleteNumber=1086827&eventNumber=0
+    and save as name_runlog.csv. Only the Event and Run Date columns are
+    used.
+    """
+    subfolder = path.normpath("user")
+    filename = path.normpath(name+"_runlog.csv")
+    user_file = path.join(subfolder, filename)
+    if path.exists(user_file):
+        runlog = pd.read_csv(user_file, engine="python")
+    else:
+        raise IOError("User run log file not found")
+    runlog = runlog[["Event", "Run Date"]].dropna()
+    runlog["Event"] = clean_event_names(runlog["Event"])
+    runlog["Date"] = pd.to_datetime(runlog["Run Date"], dayfirst=True)
+    runlog = runlog[["Date", "Event"]].sort_values("Date", kind="mergesort")
+    runlog.reset_index(drop=True, inplace=True)
+    return runlog
+
+
 def group_parkrun(names=[]):
     group_parkruns = pd.DataFrame({"Event": [""], "Runs": [0]})
 
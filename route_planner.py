@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Route planner
+Created on Mon Oct 19 17:55:06 2026
+
+Recommends unvisited parkruns by the UK area they would add to an athlete's
+coverage, weighted by their distance from home. The area of each event comes
+from the areas attribute table and the distances from the nearest_parkrun
+KD-tree, both cached next to the shapefiles, so a query is a few array
+operations and a whole club is scored at once.
+
+An event distance_scale_km from home scores half its area, one twice as far
+a third, and so on.
+"""
+
+import numpy as np
+import pandas as pd
+import personal_parkrun
+import parkrun_names
+import nearest_parkrun
+
+__version__ = 2.0
+
+distance_scale_km = 50.0
+
+# nearest parkruns scored for each athlete if there's no radius
+max_candidates = 200
+
+
+class RoutePlanner(object):
+    """
+    Area gain of each parkrun, aligned with a nearest_parkrun.ParkrunIndex
+
+    Input
+    -----
+    parkrun_index: nearest_parkrun.ParkrunIndex
+
+    areas: DataFrame
+        "id" and "area" of each parkrun area, such as
+        TVMplotting.import_attributes("uk_parkrun_areas")
+    """
+
+    def __init__(self, parkrun_index, areas, scale_km=distance_scale_km):
+        self.index = parkrun_index
+        self.scale_km = scale_km
+        area = pd.Series(np.asarray(areas["area"], dtype=float),
+                         index=np.asarray(areas["id"]))
+        area = area[~area.index.duplicated()]
+        # percent of the UK area gained by each index row, 0 if the parkrun
+        # has no area
+        self.gain = (area.reindex(parkrun_index.ids).fillna(0).values
+                     / area.sum() * 100)
+        ids = pd.Series(np.arange(len(parkrun_index)),
+                        index=parkrun_index.ids)
+        self.rows = ids[~ids.index.duplicated()]
+
+    def completed_rows(self, completed):
+        """
+        Boolean array over the index rows of a set of completed parkrun ids
+        """
+        done = np.zeros(len(self.index), dtype=bool)
+        rows = self.rows.reindex(list(completed)).dropna()
+        done[rows.values.astype(int)] = True
+        return done
+
+    def score(self, gain, distance_km):
+        return gain / (1 + distance_km / self.scale_km)
+
+    def rank(self, completed, lon, lat, top=10, radius_km=None):
+        """
+        Best unvisited parkruns for each athlete.
+
+        Input
+        -----
+        completed: list of sets
+            completed parkrun ids of each athlete, see
+            parkrun_names.completed_ids
+
+        lon, lat: arrays
+            home location of each athlete
+
+        top: int
+            number of recommendations per athlete
+
+        radius_km: float, optional
+            only recommend parkruns within this distance of home. Otherwise
+            the nearest max_candidates parkruns are scored.
+
+        Returns
+        -------
+        DataFrame with the athlete (position in completed), rank, id, m2,
+        distance_km, area_gain (% of UK area) and score of each
+        recommendation, empty if there are no athletes
+        """
+        if len(completed) == 0:
+            return pd.DataFrame({"athlete": np.zeros(0, dtype=int),
+                                 "rank": np.zeros(0, dtype=int),
+                                 "id": self.index.ids[:0],
+                                 "m2": self.index.names[:0],
+                                 "distance_km": np.zeros(0),
+                                 "area_gain": np.zeros(0),
+                                 "score": np.zeros(0)})
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        k = max_candidates
+        if radius_km is not None:
+            k = self.index.count_within(lon, lat, radius_km).max()
+        k = max(min(k, len(self.index)), 1)
+        distance, rows = self.index.nearest(lon, lat, k=k)
+
+        done = np.vstack([self.completed_rows(athlete_completed)
+                          for athlete_completed in completed])
+        gain = self.gain[rows]
+        score = self.score(gain, distance)
+        exclude = done[np.arange(len(done))[:, None], rows] | (gain <= 0)
+        if radius_km is not None:
+            exclude |= distance > radius_km
+        score[exclude] = -np.inf
+
+        top = min(top, k)
+        order = np.argsort(-score, axis=1, kind="stable")[:, :top]
+        athlete = np.repeat(np.arange(len(rows)), top)
+        picked = rows[athlete, order.ravel()]
+        picked_score = score[athlete, order.ravel()]
+        ranked = pd.DataFrame({
+                "athlete": athlete,
+                "rank": np.tile(np.arange(1, top + 1), len(rows)),
+                "id": self.index.ids[picked],
+                "m2": self.index.names[picked],
+                "distance_km": distance[athlete, order.ravel()],
+                "area_gain": self.gain[picked],
+                "score": picked_score})
+        ranked = ranked[np.isfinite(picked_score)]
+        ranked.reset_index(drop=True, inplace=True)
+        return ranked
+
+    def plan(self, completed, lon, lat, k=5, radius_km=50):
+        """
+        Greedy plan of k unvisited parkruns within radius_km of home.
+
+        Area gains add, as the areas don't overlap, so each step takes the
+        best scoring parkrun left, with the distance measured from the
+        previous parkrun in the plan rather than from home, keeping
+        consecutive runs close together.
+
+        Returns
+        -------
+        DataFrame with the step, id, m2, leg_km (from the previous step),
+        home_km, area_gain and total_gain of each parkrun in the plan
+        """
+        pool = np.asarray(self.index.within(lon, lat, radius_km)[0],
+                          dtype=int)
+        pool = pool[~self.completed_rows(completed)[pool]
+                    & (self.gain[pool] > 0)]
+        xyz = nearest_parkrun.lonlat_to_xyz(self.index.lon[pool],
+                                            self.index.lat[pool])
+        home = nearest_parkrun.lonlat_to_xyz(lon, lat)[0]
+        home_km = nearest_parkrun.chord_to_km(
+                np.linalg.norm(xyz - home, axis=1))
+
+        current = home
+        taken = np.zeros(len(pool), dtype=bool)
+        steps, legs = [], []
+        for step in range(min(k, len(pool))):
+            leg_km = nearest_parkrun.chord_to_km(
+                    np.linalg.norm(xyz - current, axis=1))
+            score = self.score(self.gain[pool], leg_km)
+            score[taken] = -np.inf
+            best = np.argmax(score)
+            taken[best] = True
+            steps.append(best)
+            legs.append(leg_km[best])
+            current = xyz[best]
+
+        rows = pool[steps]
+        plan = pd.DataFrame({"step": np.arange(1, len(rows) + 1),
+                             "id": self.index.ids[rows],
+                             "m2": self.index.names[rows],
+                             "leg_km": legs,
+                             "home_km": home_km[steps],
+                             "area_gain": self.gain[rows]})
+        plan["total_gain"] = plan["area_gain"].cumsum()
+        return plan
+
+
+def load_planner(points="uk_parkruns", areas="uk_parkrun_areas"):
+    """
+    RoutePlanner from the saved parkrun index and areas attribute table
+    """
+    import TVMplotting
+    return RoutePlanner(nearest_parkrun.load_index(points),
+                        TVMplotting.import_attributes(areas))
+
+
+def club_history(names):
+    """
+    Completed parkrun ids and home parkrun (most run) of each athlete, with
+    the event names of the whole club matched in one call
+
+    Returns
+    -------
+    (completed, homes): list of sets of ids, and array of home ids (-1 if
+    no event matched)
+    """
+    runs = pd.concat([personal_parkrun.personal_parkrun_df(name).assign(
+            athlete=i) for i, name in enumerate(names)], ignore_index=True)
+    runs["id"] = parkrun_names.match_events(runs["Event"].values)
+    runs = runs[runs["id"] >= 0]
+    completed = [set() for name in names]
+    for athlete, ids in runs.groupby("athlete")["id"]:
+        completed[athlete] = set(ids.tolist())
+    homes = np.full(len(names), -1, dtype=int)
+    most_run = runs.sort_values("Runs", ascending=False,
+                                kind="mergesort").drop_duplicates("athlete")
+    homes[most_run["athlete"].values] = most_run["id"].values
+    return completed, homes
+
+
+def club_recommendations(names, lon=None, lat=None, top=10, radius_km=None,
+                         planner=None):
+    """
+    Recommended next parkruns for every athlete in a club, in one batch.
+
+    Input
+    -----
+    names: list of str
+        athlete names, see personal_parkrun.personal_parkrun_df
+
+    lon, lat: arrays, optional
+        home location of each athlete. Defaults to each athlete's most run
+        parkrun.
+
+    Returns
+    -------
+    RoutePlanner.rank DataFrame, with the athlete name
+    """
+    if planner is None:
+        planner = load_planner()
+    completed, homes = club_history(names)
+    names = np.asarray(names)
+    if lon is None or lat is None:
+        known = homes >= 0
+        if not known.all():
+            print("No home parkrun found for: {}".format(
+                    ", ".join(names[~known])))
+        rows = planner.rows.reindex(homes[known]).values.astype(int)
+        lon = planner.index.lon[rows]
+        lat = planner.index.lat[rows]
+        names = names[known]
+        completed = [c for c, k in zip(completed, known) if k]
+    ranked = planner.rank(completed, lon, lat, top=top, radius_km=radius_km)
+    ranked.insert(0, "name", names[ranked.pop("athlete").values])
+    return ranked
+
+
+def recommend(name="scot", lon=None, lat=None, top=10, radius_km=None):
+    """
+    Recommended next parkruns for one athlete
+    """
+    return club_recommendations([name], lon=lon, lat=lat, top=top,
+                                radius_km=radius_km)
+
+
+def plan_route(name="scot", lon=None, lat=None, k=5, radius_km=50):
+    """
+    Greedy plan of k parkruns within radius_km of home for one athlete, see
+    RoutePlanner.plan
+    """
+    planner = load_planner()
+    completed, homes = club_history([name])
+    if lon is None or lat is None:
+        if homes[0] < 0:
+            raise ValueError("No home parkrun found, give lon and lat")
+        row = int(planner.rows[homes[0]])
+        lon, lat = planner.index.lon[row], planner.index.lat[row]
+    return planner.plan(completed[0], lon, lat, k=k, radius_km=radius_km)
+
+
+if __name__ == "__main__":
+    print(recommend("scot", top=5))
+    print(plan_route("scot", k=5, radius_km=50))
+    pass
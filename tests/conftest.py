@@ -0,0 +1,59 @@
+"""
+Shared fixtures. The modules use paths relative to the working directory
+(shapefiles/, user/), so tests run in a temporary copy of that layout.
+"""
+
+import os
+import shutil
+import sys
+from os import path
+import numpy as np
+import pandas as pd
+import pytest
+
+repo_dir = path.dirname(path.dirname(path.abspath(__file__)))
+if repo_dir not in sys.path:
+    sys.path.insert(0, repo_dir)
+
+
+def read_repo_csv(filename):
+    import parkrun_names
+    return parkrun_names._read_csv(path.join(repo_dir, filename))
+
+
+@pytest.fixture
+def uk_points():
+    """
+    UK parkrun points as made by TVMsetup.create_parkrun_point_shp, without
+    the geometry
+    """
+    points = read_repo_csv("uk_parkruns.csv")
+    points["m2"] = points["m"].str.replace(" Park", "")
+    return points
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch, uk_points):
+    """
+    Temporary working directory with a name index and an areas attribute
+    table (random areas) for the UK parkruns
+    """
+    import parkrun_names
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("shapefiles")
+    os.makedirs("user")
+    for filename in ["aliases.csv", "world_parkruns.csv"]:
+        if path.exists(path.join(repo_dir, filename)):
+            shutil.copy(path.join(repo_dir, filename), filename)
+    parkrun_names.build_index(uk_points)
+    areas = uk_points[["id", "m", "m2", "r"]].copy()
+    areas["area"] = np.random.RandomState(0).uniform(0.001, 0.1, len(areas))
+    areas.to_csv(path.join("shapefiles", "uk_parkrun_areas.csv"),
+                 index=False)
+    return areas
+
+
+def write_history(name, events, runs):
+    pd.DataFrame({"Event": [event + " parkrun" for event in events],
+                  "Runs": runs}).to_csv(
+            path.join("user", name + "_parkruns.csv"), index=False)
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+import bulk_summary
+from conftest import write_history
+
+
+def reference_summary(personal_runs_df, uk_parkrun_areas):
+    """
+    The statistics as personal_summary computed them before
+    summary_metrics, matching events to areas by m2
+    """
+    areas = uk_parkrun_areas.copy()
+    areas["completed"] = areas["m2"].isin(
+            personal_runs_df["Event"].values).astype(int)
+    areas["completed_area"] = areas["area"] * areas["completed"]
+    grouped = areas.groupby(["r"])
+    total_by_region = grouped["m2"].agg(["count"])
+    completed_by_region = grouped["completed"].agg(["sum"])
+
+    personal_runs = personal_runs_df["Runs"].sum()
+    p_index = 0
+    while (personal_runs_df["Runs"] > p_index).sum() > p_index:
+        p_index += 1
+    different_personal_runs = len(personal_runs_df["Event"])
+    personal_uk_runs = areas["completed"].sum()
+    personal_london_runs = completed_by_region["sum"][10]
+    return {"total_runs": personal_runs,
+            "different_runs": different_personal_runs,
+            "p_index": p_index,
+            "tourist_ratio": different_personal_runs / personal_runs,
+            "uk_runs": personal_uk_runs,
+            "percent_uk_runs": personal_uk_runs / len(areas) * 100,
+            "percent_uk_area": (areas["completed_area"].sum()
+                                / areas["area"].sum() * 100),
+            "london_runs": personal_london_runs,
+            "percent_london_runs": (personal_london_runs
+                                    / total_by_region["count"][10] * 100)}
+
+
+@pytest.fixture
+def histories(workspace):
+    """
+    Histories of a few athletes at events with unambiguous m2 names
+    """
+    unique = workspace[~workspace["m2"].duplicated(keep=False)]
+    rng = np.random.RandomState(0)
+    histories = {}
+    for i in range(12):
+        events = rng.choice(unique["m2"].values, rng.randint(1, 40),
+                            replace=False)
+        runs = rng.randint(1, 30, len(events))
+        write_history("athlete{:d}".format(i), events, runs)
+        histories["athlete{:d}".format(i)] = pd.DataFrame({"Event": events,
+                                                          "Runs": runs})
+    return histories
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_export_matches_reference(workspace, histories, processes):
+    result = bulk_summary.export_summaries(filepath="out/summaries.csv",
+                                           chunk_size=5, processes=processes)
+    assert result["athletes"] == len(histories)
+    summaries = pd.read_csv("out/summaries.csv").set_index("name")
+    assert sorted(summaries.index) == sorted(histories)
+    for name, history in histories.items():
+        expected = reference_summary(history, workspace)
+        for column, value in expected.items():
+            assert summaries.loc[name, column] == pytest.approx(value), (
+                    name, column)
+
+
+def test_failed_athletes_are_reported(workspace, histories, capsys):
+    write_history("empty", [], [])
+    names = sorted(histories)[:3] + ["nobody", "empty"]
+    result = bulk_summary.export_summaries(names, filepath="summaries.csv",
+                                           processes=1)
+    assert result["athletes"] == 3
+    assert result["failed"] == 2
+    assert len(pd.read_csv("summaries.csv")) == 3
+    out = capsys.readouterr().out
+    assert "5/5 athletes" in out
+    assert "Failed empty: No parkruns in history" in out
+
+
+@pytest.mark.parametrize("filename", ["summaries.csv", "summaries.parquet"])
+def test_no_athletes_writes_empty_table(workspace, filename):
+    if filename.endswith(".parquet"):
+        pytest.importorskip("pyarrow")
+    result = bulk_summary.export_summaries(["nobody"], filepath=filename,
+                                           processes=1)
+    assert result["failed"] == 1
+    if filename.endswith(".parquet"):
+        table = pd.read_parquet(filename)
+    else:
+        table = pd.read_csv(filename)
+    assert len(table) == 0
+    assert list(table.columns) == bulk_summary.columns
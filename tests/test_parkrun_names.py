@@ -0,0 +1,40 @@
+import pytest
+import parkrun_names
+from conftest import read_repo_csv
+
+
+@pytest.fixture(scope="module")
+def overseas():
+    world = read_repo_csv("world_parkruns.csv")
+    return world.loc[world["c"] != parkrun_names.home_country, "m"].values
+
+
+@pytest.fixture(params=[True, False], ids=["overseas", "no_overseas"])
+def index(request, uk_points, overseas):
+    return parkrun_names.NameIndex(
+            uk_points, overseas=overseas if request.param else None)
+
+
+def test_park_names_keep_their_own_id(index):
+    assert index.match(["Preston Park", "Preston"]).tolist() == [525, 59]
+    assert index.match(["Bushy Park", "Bushy"]).tolist() == [1, 1]
+    assert "preston" in index.keys and "prestonpark" in index.keys
+
+
+@pytest.mark.parametrize("name", ["Cambridge NZ", "Mansfield OH",
+                                  "Mansfield QLD"])
+def test_overseas_names_dont_match(index, name):
+    assert index.match([name + " parkrun"]).tolist() == [-1]
+    assert index.lookup("Cambridge") == 128
+    assert index.lookup("Mansfield") == 174
+
+
+def test_uk_names_match_own_id(index, uk_points):
+    for column in ["m", "n"]:
+        ids = index.match(uk_points[column].values)
+        assert (ids == uk_points["id"].values).all()
+
+
+def test_no_overseas_name_matches(uk_points, overseas):
+    index = parkrun_names.NameIndex(uk_points, overseas=overseas)
+    assert (index.match(overseas) == -1).all()
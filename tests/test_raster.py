@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from shapely.geometry import Polygon, box
+
+gpd = pytest.importorskip("geopandas")
+import TVMraster  # noqa: E402
+
+
+@pytest.mark.parametrize("inner_first", [True, False])
+def test_hole_keeps_area_inside_it(inner_first):
+    inner = box(1, 51, 3, 53)
+    outer = Polygon(box(0, 50, 4, 54).exterior.coords,
+                    [inner.exterior.coords])
+    geometry = [inner, outer] if inner_first else [outer, inner]
+    areas = gpd.GeoDataFrame({"id": [1, 2], "geometry": geometry})
+    labels, ids = TVMraster.rasterize_areas(areas, width=100)
+
+    counts = np.bincount(labels.ravel(), minlength=4)
+    inner_label = 1 if inner_first else 2
+    # a third of the pixels of the outer area, less the borders
+    assert counts[inner_label] > 0.25 * counts[3 - inner_label]
@@ -0,0 +1,24 @@
+import nearest_parkrun
+import route_planner
+from conftest import write_history
+
+
+def test_recommendations_skip_athletes_without_uk_runs(workspace, uk_points,
+                                                       capsys):
+    planner = route_planner.RoutePlanner(
+            nearest_parkrun.ParkrunIndex(uk_points), workspace)
+    write_history("dane", ["Amager Fælled"], [3])
+    write_history("scot", ["Bushy Park", "Richmond Park"], [20, 5])
+
+    ranked = route_planner.club_recommendations(["dane"], top=5,
+                                                planner=planner)
+    assert "No home parkrun found for: dane" in capsys.readouterr().out
+    assert len(ranked) == 0
+    assert list(ranked.columns) == ["name", "rank", "id", "m2",
+                                    "distance_km", "area_gain", "score"]
+
+    ranked = route_planner.club_recommendations(["dane", "scot"], top=5,
+                                                planner=planner)
+    assert (ranked["name"] == "scot").all()
+    assert ranked["rank"].tolist() == [1, 2, 3, 4, 5]
+    assert not ranked["id"].isin([1, 4]).any()
@@ -0,0 +1,50 @@
+import pytest
+from shapely.geometry import MultiPolygon, Point, box
+from shapely.ops import unary_union
+
+gpd = pytest.importorskip("geopandas")
+pytest.importorskip("cartopy")
+import TVMbenchmark  # noqa: E402
+import TVMsetup  # noqa: E402
+from VoronoiMapping import voronoi_polygons  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def inlet_coast():
+    """
+    Islands of a synthetic coast with a long inlet, which cuts voronoi
+    cells into pieces separated from their parkrun, with the parkrun points
+    and their voronoi diagram
+    """
+    country_gdf = TVMbenchmark.synthetic_coastline()[0]
+    inlet = box(-2.05, 48, -1.95, 55.5)
+    islands = [country_gdf.geometry[0].difference(inlet),
+               country_gdf.geometry[1]]
+    parkruns = TVMbenchmark.synthetic_parkruns(300)
+    points = gpd.GeoDataFrame(parkruns.assign(geometry=[
+            Point(lon, lat) for lon, lat in zip(parkruns["lo"],
+                                                parkruns["la"])]))
+    voronoi = voronoi_polygons(
+            points, gpd.GeoDataFrame({"geometry": [MultiPolygon(islands)]}))
+    return gpd.GeoDataFrame({"geometry": islands}), points, voronoi
+
+
+def test_merged_ghosts_tile_the_land(inlet_coast, tmp_path, monkeypatch):
+    uk_map, points, voronoi = inlet_coast
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "shapefiles").mkdir()
+    land = unary_union(list(uk_map.geometry)).area
+
+    areas = {}
+    for merge_ghosts in [False, True]:
+        geoms = list(TVMsetup.assign_parkrun_areas(
+                points, voronoi, uk_map.copy(), snap=True,
+                merge_ghosts=merge_ghosts)["geometry"])
+        assert all(geom.geom_type == "Polygon" for geom in geoms)
+        total = sum(geom.area for geom in geoms)
+        # no two areas overlap
+        assert unary_union(geoms).area == pytest.approx(total, rel=1e-9)
+        areas[merge_ghosts] = total
+
+    assert areas[False] < land * (1 - 1e-3)
+    assert areas[True] == pytest.approx(land, rel=1e-9)
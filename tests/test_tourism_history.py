@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+import TVMplotting
+import tourism_history
+
+
+def random_runlog(uk_points, n_runs=150, seed=0):
+    """
+    Dated runs at a few UK events, including two spellings of Bushy Park
+    and an overseas event
+    """
+    rng = np.random.RandomState(seed)
+    events = list(rng.choice(uk_points["m"].values, 20, replace=False))
+    events += ["Bushy", "Bushy Park", "Albert Melbourne"]
+    # a few favourite events, so the p-index gets past 1
+    weights = rng.pareto(1.0, len(events)) + 0.1
+    return pd.DataFrame({
+            "Date": pd.date_range("2015-01-03", periods=n_runs, freq="7D"),
+            "Event": rng.choice(events, n_runs, p=weights / weights.sum())})
+
+
+def test_extend_in_parts_matches_single_extend(workspace, uk_points):
+    runlog = random_runlog(uk_points)
+    whole = tourism_history.TourismHistory(workspace)
+    whole.extend(runlog)
+    parts = tourism_history.TourismHistory(workspace)
+    for start in range(0, len(runlog), 40):
+        parts.extend(runlog.iloc[start:start + 40])
+    pd.testing.assert_frame_equal(whole.series, parts.series)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_series_matches_summary_metrics(workspace, uk_points, seed):
+    runlog = random_runlog(uk_points, seed=seed)
+    history = tourism_history.TourismHistory(workspace)
+    series = history.extend(runlog)
+
+    for k in range(1, len(runlog) + 1):
+        counts = runlog["Event"].iloc[:k].value_counts()
+        personal_runs_df = pd.DataFrame({"Event": counts.index,
+                                         "Runs": counts.values})
+        metrics = TVMplotting.summary_metrics(personal_runs_df, workspace)
+        row = series.iloc[k - 1]
+        for column in ["total_runs", "different_runs", "p_index",
+                       "uk_runs"]:
+            assert row[column] == metrics[column], (k, column)
+        for column in ["tourist_ratio", "percent_uk_runs",
+                       "percent_uk_area"]:
+            assert row[column] == pytest.approx(metrics[column]), (k, column)
+
+
+def test_saved_history_is_extended(workspace, uk_points):
+    runlog = random_runlog(uk_points)
+    log = pd.DataFrame({"Event": runlog["Event"] + " parkrun",
+                        "Run Date": runlog["Date"].dt.strftime("%d/%m/%Y")})
+    log.iloc[:100].to_csv("user/tester_runlog.csv", index=False)
+    tourism_history.tourism_history("tester", areas=workspace)
+    log.to_csv("user/tester_runlog.csv", index=False)
+    extended = tourism_history.tourism_history("tester", areas=workspace)
+    rebuilt = tourism_history.tourism_history("tester", areas=workspace,
+                                              rebuild=True)
+    pd.testing.assert_frame_equal(extended.series, rebuilt.series)
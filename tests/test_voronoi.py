@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from scipy.spatial import Voronoi
+from shapely.geometry import Point, Polygon
+
+# VoronoiMapping imports the geopandas stack at the top
+pytest.importorskip("geopandas")
+VoronoiMapping = pytest.importorskip("VoronoiMapping")
+
+
+def baseline_polygons(vor, radius=None):
+    """
+    The per region loop voronoi_finite_polygons_2d used before it was
+    vectorized
+    """
+    new_regions = []
+    new_vertices = vor.vertices.tolist()
+
+    center = vor.points.mean(axis=0)
+    if radius is None:
+        radius = np.ptp(vor.points)
+
+    all_ridges = {}
+    for (p1, p2), (v1, v2) in zip(vor.ridge_points, vor.ridge_vertices):
+        all_ridges.setdefault(p1, []).append((p2, v1, v2))
+        all_ridges.setdefault(p2, []).append((p1, v1, v2))
+
+    for p1, region in enumerate(vor.point_region):
+        vertices = vor.regions[region]
+        if all(v >= 0 for v in vertices):
+            new_regions.append(vertices)
+            continue
+        new_region = [v for v in vertices if v >= 0]
+        for p2, v1, v2 in all_ridges[p1]:
+            if v2 < 0:
+                v1, v2 = v2, v1
+            if v1 >= 0:
+                continue
+            t = vor.points[p2] - vor.points[p1]
+            t /= np.linalg.norm(t)
+            n = np.array([-t[1], t[0]])
+            midpoint = vor.points[[p1, p2]].mean(axis=0)
+            direction = np.sign(np.dot(midpoint - center, n)) * n
+            far_point = vor.vertices[v2] + direction * radius
+            new_region.append(len(new_vertices))
+            new_vertices.append(far_point.tolist())
+        vs = np.asarray([new_vertices[v] for v in new_region])
+        c = vs.mean(axis=0)
+        angles = np.arctan2(vs[:, 1] - c[1], vs[:, 0] - c[0])
+        new_regions.append(np.array(new_region)[np.argsort(angles)].tolist())
+
+    vertices = np.asarray(new_vertices)
+    return [Polygon(vertices[region]) for region in new_regions]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("n_points", [5, 50, 500])
+def test_finite_regions_match_baseline(seed, n_points):
+    rng = np.random.RandomState(seed)
+    points = np.column_stack([rng.uniform(-8, 2, n_points),
+                              rng.uniform(50, 59, n_points)])
+    vor = Voronoi(points)
+    vertices, offsets = VoronoiMapping.finite_voronoi_regions(vor)
+    polygons = VoronoiMapping.polygons_from_offsets(vertices, offsets)
+    expected = baseline_polygons(vor)
+
+    assert len(polygons) == n_points
+    for polygon, baseline, point in zip(polygons, expected, points):
+        assert polygon.is_valid
+        assert polygon.symmetric_difference(baseline).area < 1e-9
+        assert polygon.contains(Point(point))
+
+
+def test_spherical_cells_tile_the_globe():
+    from shapely.ops import unary_union
+    from conftest import read_repo_csv
+    world = read_repo_csv("world_parkruns.csv").drop_duplicates(["lo", "la"])
+    polygons = VoronoiMapping.spherical_voronoi_polygons(
+            world["lo"].values, world["la"].values)
+
+    assert len(polygons) == len(world)
+    for polygon, lon, lat in zip(polygons, world["lo"], world["la"]):
+        assert polygon.is_valid
+        assert polygon.covers(Point(lon, lat))
+    # cells cover the whole lon/lat rectangle, without overlapping
+    total = sum(polygon.area for polygon in polygons)
+    assert total == pytest.approx(360 * 180, rel=1e-9)
+    assert unary_union(polygons).area == pytest.approx(total, rel=1e-9)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Tourism history
+Created on Mon Oct 19 17:53:42 2026
+
+Tourism statistics through time, from dated run logs (see
+personal_parkrun.personal_runlog_df). The series is built in a single pass
+over the runs in date order, keeping running totals, so the statistics at
+every run cost no more than the final ones. New runs extend the series from
+the saved running totals.
+"""
+
+import pickle
+from os import path
+import numpy as np
+import pandas as pd
+import personal_parkrun
+import parkrun_names
+
+__version__ = 2.0
+
+user_folder = path.normpath("user")
+
+# region used for the London statistics in personal_summary
+london_region = 10
+
+columns = ["Date", "Event", "total_runs", "different_runs", "tourist_ratio",
+           "p_index", "uk_runs", "percent_uk_runs", "percent_uk_area",
+           "london_runs"]
+
+
+def area_table(filename="uk_parkrun_areas"):
+    """
+    id, area and region of each parkrun area
+    """
+    import TVMplotting
+    areas = TVMplotting.import_attributes(filename)
+    return areas[["id", "area", "r"]]
+
+
+class TourismHistory(object):
+    """
+    Running tourism statistics for one athlete or a group.
+
+    Input
+    -----
+    areas: DataFrame
+        id, area and r (region) of each parkrun area, see area_table
+    """
+
+    def __init__(self, areas):
+        self.area = dict(zip(areas["id"], areas["area"]))
+        self.london = set(areas.loc[areas["r"] == london_region, "id"])
+        self.total_area = float(areas["area"].sum())
+        self.n_uk = len(areas)
+        self.n_london = len(self.london)
+        # running totals
+        self.counts = {}
+        self.completed = set()  # parkrun ids, several names may share one
+        self.n_at_least = [0]  # number of events run at least k times
+        self.p_index = 0
+        self.total_runs = 0
+        self.uk_runs = 0
+        self.london_runs = 0
+        self.completed_area = 0.0
+        self.last_date = None
+        self.series = pd.DataFrame(columns=columns)
+
+    def extend(self, runs):
+        """
+        Adds runs to the series
+
+        Input
+        -----
+        runs: DataFrame
+            Date and Event of each run, such as personal_runlog_df. Must not
+            be earlier than runs already added.
+
+        Returns
+        -------
+        the new rows of the series
+        """
+        runs = runs.sort_values("Date", kind="mergesort")
+        if len(runs) == 0:
+            return self.series.iloc[0:0]
+        first_date = runs["Date"].iloc[0]
+        if self.last_date is not None and first_date < self.last_date:
+            raise ValueError("Runs must not be earlier than the last run "
+                             "added, build a new history instead")
+        events = runs["Event"].values
+        ids = parkrun_names.match_events(events)
+
+        n = len(runs)
+        total = np.empty(n, dtype=int)
+        different = np.empty(n, dtype=int)
+        p_index = np.empty(n, dtype=int)
+        uk = np.empty(n, dtype=int)
+        london = np.empty(n, dtype=int)
+        area = np.empty(n)
+        for i, (event, parkrun_id) in enumerate(zip(events, ids)):
+            count = self.counts.get(event, 0) + 1
+            self.counts[event] = count
+            self.total_runs += 1
+            if parkrun_id in self.area and parkrun_id not in self.completed:
+                self.completed.add(parkrun_id)
+                self.uk_runs += 1
+                self.completed_area += self.area[parkrun_id]
+                self.london_runs += parkrun_id in self.london
+            # p-index: the largest p with p events each run at least p times
+            if count == len(self.n_at_least):
+                self.n_at_least.append(0)
+            self.n_at_least[count] += 1
+            if (self.p_index + 1 < len(self.n_at_least)
+                    and self.n_at_least[self.p_index + 1] > self.p_index):
+                self.p_index += 1
+            total[i] = self.total_runs
+            different[i] = len(self.counts)
+            p_index[i] = self.p_index
+            uk[i] = self.uk_runs
+            london[i] = self.london_runs
+            area[i] = self.completed_area
+        self.last_date = runs["Date"].iloc[-1]
+
+        rows = pd.DataFrame({"Date": runs["Date"].values,
+                             "Event": events,
+                             "total_runs": total,
+                             "different_runs": different,
+                             "tourist_ratio": different / total,
+                             "p_index": p_index,
+                             "uk_runs": uk,
+                             "percent_uk_runs": uk / self.n_uk * 100,
+                             "percent_uk_area": (area / self.total_area
+                                                 * 100),
+                             "london_runs": london}, columns=columns)
+        if len(self.series):
+            self.series = pd.concat([self.series, rows], ignore_index=True)
+        else:
+            self.series = rows
+        return rows
+
+    def by_date(self, freq=None):
+        """
+        Statistics at the end of each run date, or of each period of freq
+        (a pandas offset alias) if given
+        """
+        series = self.series.drop(columns="Event")
+        if freq is None:
+            return series.groupby("Date").last()
+        return series.set_index("Date").resample(freq).last().ffill()
+
+    def first_visits(self):
+        """
+        Date of the first run at each event
+        """
+        series = self.series
+        return series.loc[~series["Event"].duplicated(), ["Date", "Event"]]
+
+
+def history_filepath(name):
+    return path.join(user_folder, path.normpath(name + "_history.pkl"))
+
+
+def _runlog(name):
+    if type(name) == list:
+        runlog = pd.concat([personal_parkrun.personal_runlog_df(n)
+                            for n in name], ignore_index=True)
+        return runlog.sort_values("Date", kind="mergesort")
+    return personal_parkrun.personal_runlog_df(name)
+
+
+def tourism_history(name, areas=None, rebuild=False):
+    """
+    Tourism history for an athlete, or a list of athletes as a group.
+
+    The history is saved in user/ and extended with any runs in the run log
+    after the last saved run, so only new runs are processed. It's rebuilt
+    from scratch if the run log has had earlier runs added or removed.
+
+    Returns
+    -------
+    TourismHistory, see its series and by_date
+    """
+    runlog = _runlog(name)
+    filepath = None
+    if type(name) == str:
+        filepath = history_filepath(name)
+
+    history = None
+    if filepath is not None and path.exists(filepath) and not rebuild:
+        history = TourismHistory.__new__(TourismHistory)
+        with open(filepath, "rb") as f:
+            vars(history).update(pickle.load(f))
+        done = runlog[runlog["Date"] <= history.last_date]
+        # histories saved before completed ids were kept are rebuilt
+        if (len(done) != history.total_runs
+                or not hasattr(history, "completed")):
+            history = None
+        else:
+            runlog = runlog[runlog["Date"] > history.last_date]
+
+    if history is None:
+        if areas is None:
+            areas = area_table()
+        history = TourismHistory(areas)
+    history.extend(runlog)
+
+    if filepath is not None:
+        with open(filepath, "wb") as f:
+            pickle.dump(vars(history), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return history
+
+
+if __name__ == "__main__":
+    scot = tourism_history("scot")
+    print(scot.by_date())
+    pass